@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks and sanity checks for the ZX utilities.
+"""
+__version__ = 1.0
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import zxutils
+
+# A sample of typical ZX Basic lines in the form written by the zxbasic decoder.
+SAMPLE_BASIC = [
+    'REM Loader <UDG A> PRINT 1',
+    'BORDER 0: PAPER 0: INK 7: CLEAR 24999',
+    'LET total=0: FOR i=1 TO 10: LET total=total+i: NEXT i',
+    'PRINT AT 0,0;"Score: ";total;" <UDG B>"',
+    'IF INKEY$ ="" THEN GO TO 40',
+    'DEF FN f(x,y)=x*y+BIN 101',
+    'POKE 23606,0: RANDOMIZE USR 32768',
+    'PRINT 1.5E3;-.25;PI ;"↑£"',
+    'LOAD ""SCREEN$ : LOAD ""CODE 32768',
+    'GO SUB 1000: PRINT FN f(2,3)',
+    'LET XAT=1: LET AIN=3: PRINT XAT+AIN',
+]
+
+def bench_basic(num_lines):
+    """
+    Check that ZX Basic text survives an encode/decode round trip and report the tokenizer throughput.
+    """
+    text = "\n".join("{} {}".format(i + 1, SAMPLE_BASIC[i % len(SAMPLE_BASIC)]) for i in range(num_lines))
+
+    start = time.perf_counter()
+    data = text.encode('zxbasic')
+    encode_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    decoded = data.decode('zxbasic')
+    decode_time = time.perf_counter() - start
+
+    if decoded != text:
+        raise AssertionError("ZX Basic round trip failed")
+    if decoded.encode('zxbasic') != data:
+        raise AssertionError("ZX Basic re-encoding produced different bytes")
+
+    print("zxbasic encode: {} lines, {} bytes in {:.3f}s ({:.2f} MB/s)".format(
+        num_lines, len(text), encode_time, len(text) / encode_time / 1e6))
+    print("zxbasic decode: {} bytes in {:.3f}s ({:.2f} MB/s)".format(
+        len(data), decode_time, len(data) / decode_time / 1e6))
+
+# Modules that listing a tape should never need to import.
+HEAVY_MODULES = ['PIL', 'asyncio', 'concurrent.futures', 'wave', 'zipfile', 'zxutils.audio', 'zxutils.server',
+                 'zxutils.writers']
+
+# Run in a fresh interpreter to time importing the CLI and listing a file, reporting any heavy modules loaded.
+_STARTUP_SCRIPT = """
+import contextlib, io, json, sys, time
+start = time.perf_counter()
+from zxutils.cli import main
+imported = time.perf_counter()
+with contextlib.redirect_stdout(io.StringIO()):
+    main(['list', sys.argv[1]])
+done = time.perf_counter()
+print(json.dumps({'import_ms': (imported - start) * 1000, 'list_ms': (done - imported) * 1000,
+                  'heavy': [name for name in json.loads(sys.argv[2]) if name in sys.modules]}))
+"""
+
+def bench_startup(filename, runs, budget_ms):
+    """
+    Check that `python -m zxutils list` stays within its import budget and avoids heavy modules.
+    """
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if filename is None:
+            # A TAP file holding a single header block
+            filename = os.path.join(tmpdir, "startup.tap")
+            header = bytes([0x00, 0x03]) + b"STARTUP   " + bytes([0x00, 0x1b, 0x00, 0x40, 0x00, 0x80])
+            checksum = 0
+            for byte in header:
+                checksum ^= byte
+            with open(filename, "wb") as f:
+                f.write(bytes([len(header) + 1, 0]) + header + bytes([checksum]))
+
+        cwd = os.path.dirname(os.path.abspath(__file__))
+        results = list()
+        for _ in range(runs):
+            start = time.perf_counter()
+            output = subprocess.run([sys.executable, "-c", _STARTUP_SCRIPT, filename, json.dumps(HEAVY_MODULES)],
+                                    cwd=cwd, check=True, capture_output=True, text=True).stdout
+            result = json.loads(output)
+            result['process_ms'] = (time.perf_counter() - start) * 1000
+            results.append(result)
+
+    best = min(results, key=lambda r: r['import_ms'] + r['list_ms'])
+    print("startup: import {:.1f}ms, list {:.1f}ms, process {:.1f}ms (best of {}, budget {:.1f}ms)".format(
+        best['import_ms'], best['list_ms'], min(r['process_ms'] for r in results), runs, budget_ms))
+    if best['heavy']:
+        raise AssertionError("Listing imported heavy modules: {}".format(", ".join(best['heavy'])))
+    if best['import_ms'] + best['list_ms'] > budget_ms:
+        raise AssertionError("Importing and listing took {:.1f}ms which is over the {:.1f}ms budget".format(
+            best['import_ms'] + best['list_ms'], budget_ms))
+
+def _main():
+    """
+    Application entrypoint when executing the script directly.
+    """
+    parser = argparse.ArgumentParser(description='Benchmarks for the ZX Spectrum utilities.')
+    parser.add_argument('--lines', metavar='COUNT', type=int, default=10000,
+                        help='Number of Basic lines to tokenize in the zxbasic benchmark.')
+    parser.add_argument('--startup-file', metavar='FILE', type=str,
+                        help='File to list in the startup benchmark (a small TAP file is generated by default).')
+    parser.add_argument('--startup-runs', metavar='COUNT', type=int, default=5,
+                        help='Number of interpreter starts to time in the startup benchmark.')
+    parser.add_argument('--startup-budget', metavar='MS', type=float, default=50.0,
+                        help='Maximum time allowed for importing the command line interface and listing the file.')
+
+    args = parser.parse_args()
+
+    bench_basic(args.lines)
+    bench_startup(args.startup_file, args.startup_runs, args.startup_budget)
+
+if __name__ == "__main__":
+    _main()
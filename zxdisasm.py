@@ -6,24 +6,8 @@ Z80 disassembler
 __version__ = 1.0
 
 import argparse
-import array
-import os
 
-class Emulator:
-    """
-    This class describes the virtual z80 platform.
-    """
-    def __init__(self, filename, origin, pc, max_size):
-        # Create memory and load binary data into it
-        self.memory = array.array('B', [0] * origin)
-        file_size = os.stat(filename).st_size
-        with open(filename, mode='rb') as file:
-            self.memory.fromfile(file, file_size)
-        
-        # Extend memory to cover maximum size
-        if len(self.memory) < max_size:
-            self.memory.extend([0] * (max_size - len(self.memory)))
-        print(len(self.memory))
+from zxutils.disasm import Emulator
 
 def _main():
     parser = argparse.ArgumentParser(description='Utility for disassembling Z80 binary files')
@@ -6,43 +6,63 @@ ZX Tool script for managing ZX Spectrum files.
 __version__ = 1.0
 
 import argparse
-import zipfile
+import sys
 
-from zxutils.handlers import TZXHandler, TAPHandler
+from zxutils.cli import parse_selection, write_ndjson
+from zxutils.handlers import handler_for, load_file
 
 def _main():
     """
     Application entrypoint when executing the script directly.
     """
     parser = argparse.ArgumentParser(description='Utility for processing ZX Spectrum files.')
-    parser.add_argument('file', metavar='FILE', type=str, help='ZX Spectrum file to process (supports TZX/TAP/ZIP only).')
+    parser.add_argument('file', metavar='FILE', type=str, help='ZX Spectrum file to process (supports TZX/TAP/WAV/SNA/Z80/ZIP only).')
     parser.add_argument('--dump', action='store_true', help='Dump blocks to screen.')
     parser.add_argument('--list', action='store_true', help='Output list of blocks to screen. '
                         'Any other optons are ignored if this is selected.')
+    parser.add_argument('--json', action='store_true', help='Write --list or --dump output as one JSON object per '
+                        'block (NDJSON) as each block is parsed.')
+    parser.add_argument('--payload', action='store_true', help='Include the base64 encoded block data in JSON output.')
     parser.add_argument('--block', metavar='BLOCKID', type=int, help='Process a specific block ID.')
     parser.add_argument('--prefix', metavar='FILE_PREFIX', type=str, default='block', help='File prefix to use when writing out blocks')
     parser.add_argument('--extract', metavar='LIST', type=str, help='Comma separated list of types to extract from block(s). '
                         'Valid types are: png, txt and bin (e.g --extract png,txt).')
+    parser.add_argument('--convert', metavar='OUTFILE', type=str, help='Convert to a TAP or TZX file (chosen by '
+                        'extension). Blocks that cannot be represented in the output format are dropped.')
+    parser.add_argument('--select', metavar='LIST', type=str, help='Comma separated list of block IDs or ranges to '
+                        'write when converting (e.g. --select 0,2-5).')
+    parser.add_argument('--fix-checksums', action='store_true', help='Recalculate checksums when converting.')
+    parser.add_argument('--wav', metavar='OUTFILE', type=str, help='Render the tape as audio to a WAV file.')
+    parser.add_argument('--rate', metavar='HZ', type=int, default=44100, help='Sample rate to use with --wav.')
+    parser.add_argument('--screens', action='store_true', help='Scan binary blocks for headerless screens and '
+                        'output their offsets and confidence scores.')
 
     args = parser.parse_args()
 
-    filename = args.file
-    if zipfile.is_zipfile(args.file):
-        with zipfile.ZipFile(args.file) as zipf:
-            # For now get first file in zip - this will need improving at some point
-            with zipf.open(zipf.namelist()[0], "r") as f:
-                filename = zipf.namelist()[0]
-                data = f.read()
-    else:
-        with open(args.file, "rb") as f:
-            data = f.read()
+    filename, data = load_file(args.file)
 
-    if TZXHandler.can_handle(filename, data):
-        processor = TZXHandler(data)
-    elif TAPHandler.can_handle(filename, data):
-        processor = TAPHandler(data)
-    else:
-        raise RuntimeError("The {} file appears to be an unsupported type.".format(filename))
+    processor = handler_for(filename, data)
+
+    if args.convert:
+        from zxutils.writers import writer_for # pylint: disable=import-outside-toplevel
+
+        select = parse_selection(args.select) if args.select else None
+        with open(args.convert, "wb") as f:
+            writer = writer_for(args.convert, f, args.fix_checksums)
+            writer.write_blocks(processor.iter_blocks(), select)
+        if processor.truncated:
+            sys.exit("Error: {} could not be read to the end so {} is incomplete".format(args.file, args.convert))
+        return
+
+    if args.wav:
+        from zxutils.audio import write_wav # pylint: disable=import-outside-toplevel
+
+        write_wav(processor.iter_blocks(), args.wav, args.rate)
+        return
+
+    if args.json and (args.list or args.dump):
+        write_ndjson(processor, args.block if args.dump else None, args.dump, args.payload)
+        return
 
     processor.process()
 
@@ -50,6 +70,9 @@ def _main():
         processor.summarize()
     elif args.dump:
         processor.dump(args.block)
+    elif args.screens:
+        for i, offset, size, score in processor.find_screens(args.block):
+            print("Block: {:4d} - offset 0x{:04X} ({} bytes) score {:.2f}".format(i, offset, size, score))
 
     if args.extract:
         types = [x.strip() for x in args.extract.split(",")]
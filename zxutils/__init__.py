@@ -4,6 +4,14 @@
 ZXUtils package initialization.
 """
 import codecs
-from zxutils.zxcodec import zxascii_search_function
 
-codecs.register(zxascii_search_function)
+def _codec_search_function(encoding_name):
+    """
+    Defers importing the ZX Spectrum codecs until one of them is first looked up.
+    """
+    if encoding_name not in ('zxascii', 'zxbasic'):
+        return None
+    from zxutils.zxcodec import zxascii_search_function # pylint: disable=import-outside-toplevel
+    return zxascii_search_function(encoding_name)
+
+codecs.register(_codec_search_function)
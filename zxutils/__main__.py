@@ -0,0 +1,8 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Entrypoint for running the package with `python -m zxutils`.
+"""
+from zxutils.cli import main
+
+main()
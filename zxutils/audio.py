@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Renders tape blocks as the audio a ZX Spectrum would load them from, and decodes them back from recordings.
+
+Waveforms are built a chunk of bytes at a time. Each chunk is expanded into pulse lengths with a per-byte lookup
+table and turned into samples with map/accumulate/join pipelines, so no Python code runs per pulse and only one
+chunk of audio is ever held in memory before it is streamed to the WAV file. Decoding works the same way in
+reverse: each chunk of samples is reduced to levels with bytes.translate and split into pulses with a regular
+expression, leaving only the loader state machine to run per pulse.
+"""
+
+import itertools
+import operator
+import re
+import wave
+
+from zxutils.blocks import DataBlockBinary, DataBlockPause, standard_timing
+
+# Clock speed of the 48K ZX Spectrum, all pulse lengths are in T-states of this clock.
+CPU_CLOCK = 3500000
+
+# Levels used for the two halves of a square wave (8-bit unsigned samples).
+LEVEL_HIGH = b'\xe0'
+LEVEL_LOW = b'\x20'
+
+# Number of data bytes rendered at a time.
+CHUNK_SIZE = 4096
+
+class WavRenderer:
+    """
+    Class for streaming tape blocks to a WAV file.
+    """
+    def __init__(self, file, sample_rate=44100):
+        self.sample_rate = sample_rate
+        self._wav = wave.open(file, "wb")
+        self._wav.setnchannels(1)
+        self._wav.setsampwidth(1)
+        self._wav.setframerate(sample_rate)
+        self._tstates = 0
+        self._sample = 0
+        self._high = False
+        self._bit_tables = dict()
+
+    def close(self):
+        """
+        Finish the WAV file.
+        """
+        self._wav.close()
+
+    def render(self, block):
+        """
+        Render a block. Returns False if the block does not produce any sound.
+        """
+        if isinstance(block, DataBlockBinary):
+            pause = 1000 if block.pause is None else block.pause
+            self._render_data(block.raw, block.timing or standard_timing(block.flag))
+            self._render_pause(pause)
+        elif isinstance(block, DataBlockPause) and block.pause:
+            self._render_pause(block.pause)
+        else:
+            return False
+        return True
+
+    def render_blocks(self, blocks):
+        """
+        Render a sequence of blocks. Returns the number of blocks that produced sound.
+        """
+        return sum(1 for block in blocks if self.render(block))
+
+    def _bit_table(self, zero, one):
+        """
+        Returns a lookup table from byte value to the tuple of pulse lengths for its 8 bits (MSB first).
+        """
+        key = (zero, one)
+        if key not in self._bit_tables:
+            self._bit_tables[key] = [tuple(itertools.chain.from_iterable(
+                (one, one) if byte & (0x80 >> bit) else (zero, zero) for bit in range(8))) for byte in range(256)]
+        return self._bit_tables[key]
+
+    def _render_data(self, data, timing):
+        pilot, sync1, sync2, zero, one, pilot_tone, used_bits = timing
+        self._write_pulses(itertools.chain(itertools.repeat(pilot, pilot_tone), (sync1, sync2)))
+        table = self._bit_table(zero, one)
+        last = len(data) - 1
+        for start in range(0, len(data), CHUNK_SIZE):
+            chunk = data[start:start + CHUNK_SIZE]
+            pulses = itertools.chain.from_iterable(map(table.__getitem__, chunk))
+            if start + CHUNK_SIZE > last and used_bits < 8:
+                # Only the top used_bits bits of the final byte are sent
+                pulses = itertools.chain(itertools.chain.from_iterable(map(table.__getitem__, chunk[:-1])),
+                                         table[chunk[-1]][:2 * used_bits])
+            self._write_pulses(pulses)
+
+    def _render_pause(self, pause):
+        """
+        Hold the signal low for pause milliseconds.
+        """
+        if pause <= 0:
+            return
+        if not self._high:
+            # The last pulse must be ended by an edge, so go high for the first millisecond
+            self._write_pulses((CPU_CLOCK // 1000,))
+            pause -= 1
+        self._tstates += pause * CPU_CLOCK // 1000
+        end = self._tstates * self.sample_rate // CPU_CLOCK
+        if end > self._sample:
+            self._wav.writeframesraw(LEVEL_LOW * (end - self._sample))
+            self._sample = end
+        self._high = False
+
+    def _write_pulses(self, pulses):
+        """
+        Write a sequence of pulse lengths (in T-states), each one flipping the signal level.
+        """
+        # Absolute T-state and sample position of every edge, computed without a Python level loop
+        tstates = list(itertools.accumulate(pulses, initial=self._tstates))
+        if len(tstates) < 2:
+            return
+        edges = list(map(CPU_CLOCK.__rfloordiv__, map(self.sample_rate.__mul__, tstates)))
+        edges[0] = self._sample
+        counts = map(operator.sub, edges[1:], edges[:-1])
+        levels = itertools.cycle((LEVEL_LOW, LEVEL_HIGH) if self._high else (LEVEL_HIGH, LEVEL_LOW))
+        self._wav.writeframesraw(b''.join(map(bytes.__mul__, levels, counts)))
+        self._tstates = tstates[-1]
+        self._sample = edges[-1]
+        self._high = self._high != bool((len(edges) - 1) & 1)
+
+def write_wav(blocks, filename, sample_rate=44100):
+    """
+    Render a sequence of blocks to a WAV file.
+    """
+    renderer = WavRenderer(filename, sample_rate)
+    try:
+        renderer.render_blocks(blocks)
+    finally:
+        renderer.close()
+
+# Matches each run of samples at the same level, i.e. a single pulse.
+_RUN_RE = re.compile(rb'\x00+|\x01+')
+
+# Tables that reduce the most significant byte of a sample to its level (0 or 1). 8-bit WAV samples are unsigned
+# while wider samples are signed.
+_UNSIGNED_LEVEL = bytes(1 if i >= 128 else 0 for i in range(256))
+_SIGNED_LEVEL = bytes(1 if i < 128 else 0 for i in range(256))
+
+# Number of frames read from the WAV file at a time.
+FRAMES_PER_CHUNK = 1 << 18
+
+class TapeDecoder:
+    """
+    Class for decoding tape blocks from a WAV recording using the ROM loader timings (with tolerance).
+    """
+    def __init__(self, file, tolerance=0.15):
+        self._wav = wave.open(file, "rb")
+        self.sample_rate = self._wav.getframerate()
+        scale = self.sample_rate / CPU_CLOCK
+        pilot, _, _, zero, one, _, _ = standard_timing(0)
+        self._pilot_min = pilot * (1.0 - tolerance) * scale
+        self._pilot_max = pilot * (1.0 + tolerance) * scale
+        self._sync_max = (zero + one) / 2 * scale
+        self._bit_threshold = (zero + one) * scale
+        self._pair_max = 2 * one * (1.0 + tolerance) * scale
+        self._pulse_max = one * (1.0 + tolerance) * scale
+        self._pulse_min = zero * (1.0 - 2 * tolerance) / 2 * scale
+        # The ROM loader wants at least 256 leader pulses before it looks for the sync pulses
+        self._min_pilot_pulses = 256
+
+    def pulses(self):
+        """
+        Generator that yields the length (in samples) of every pulse in the recording.
+        """
+        width = self._wav.getsampwidth()
+        step = width * self._wav.getnchannels()
+        table = _UNSIGNED_LEVEL if width == 1 else _SIGNED_LEVEL
+        carry_level, carry = None, 0
+        while True:
+            frames = self._wav.readframes(FRAMES_PER_CHUNK)
+            if not frames:
+                break
+            # Take the most significant byte of the first channel of every frame and reduce it to a level
+            levels = frames[width - 1::step].translate(table)
+            runs = list(map(len, _RUN_RE.findall(levels)))
+            if levels[0] == carry_level:
+                runs[0] += carry
+            elif carry:
+                yield carry
+            # The last run may carry on into the next chunk
+            carry_level, carry = levels[-1], runs.pop()
+            yield from runs
+        if carry:
+            yield carry
+
+    def blocks(self):
+        """
+        Generator that yields the raw bytes (flag, data and checksum) of every block found in the recording.
+        """
+        pilot_count = 0
+        pulses = self.pulses()
+        for pulse in pulses:
+            if self._pilot_min <= pulse <= self._pilot_max:
+                pilot_count += 1
+                continue
+            if pilot_count >= self._min_pilot_pulses and pulse <= self._sync_max:
+                # Found the first sync pulse, the second one is skipped before the data starts
+                if next(pulses, None) is not None:
+                    data = self._read_data(pulses)
+                    if len(data) >= 2:
+                        yield bytes(data)
+            pilot_count = 0
+
+    def _read_data(self, pulses):
+        """
+        Read pairs of pulses as bits (MSB first) until the signal stops looking like data.
+        """
+        data = bytearray()
+        byte, bits = 0, 0
+        pulse_min, pulse_max, pair_max, threshold = self._pulse_min, self._pulse_max, self._pair_max, \
+            self._bit_threshold
+        for first in pulses:
+            if first > pulse_max or first < pulse_min:
+                break
+            second = next(pulses, 0)
+            # The final pulse of a block can run into the pause, so judge that bit on its first half
+            final = second > pulse_max
+            if final:
+                second = first
+            pair = first + second
+            if second < pulse_min or pair > pair_max:
+                break
+            byte = (byte << 1) | (pair > threshold)
+            bits += 1
+            if bits == 8:
+                data.append(byte)
+                byte, bits = 0, 0
+            if final:
+                break
+        return data
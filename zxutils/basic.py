@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+A structured, random-access model of a ZX Spectrum Basic program.
+
+Nothing is decoded up front: the line index is built on first use and lines and tokens are produced on demand,
+so large programs can be scanned without formatting the whole listing as text.
+"""
+
+import bisect
+import collections
+import re
+import struct
+
+from zxutils.zxcodec import ZX_CHAR_MAP, zx_decode_basic_string, zx_decode_number
+
+# A single token within a line. kind is one of 'keyword', 'number', 'string', 'rem' or 'text'. code is the
+# keyword code (None for other kinds), text is the text as listed and value is the decoded hidden number.
+Token = collections.namedtuple('Token', ['kind', 'code', 'text', 'value'])
+
+# Line numbers can only go up to 16383, anything higher marks the start of the variables area.
+MAX_LINE_NUMBER = 0x3fff
+
+_TOKEN_REM = 234
+_TOKEN_RE = re.compile(rb'(\x0e[\s\S]{5})|("[^"]*"?)|([\xa5-\xff])|([^"\x0e\xa5-\xff]+)')
+_LITERAL_RE = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?$')
+
+class BasicLine:
+    """
+    A single line of a Basic program.
+    """
+    def __init__(self, number, offset, body):
+        self._number = number
+        self._offset = offset
+        self._body = body
+
+    @property
+    def number(self):
+        """
+        Returns the line number.
+        """
+        return self._number
+
+    @property
+    def offset(self):
+        """
+        Returns the offset of the line (including its 4 byte line number/length prefix) within the program.
+        """
+        return self._offset
+
+    @property
+    def data(self):
+        """
+        Returns the tokenized bytes of the line without the trailing ENTER character.
+        """
+        return self._body
+
+    @property
+    def text(self):
+        """
+        Returns the line as it would appear in a listing.
+        """
+        return "{} {}".format(self._number, zx_decode_basic_string(self._body).rstrip())
+
+    def tokens(self):
+        """
+        Generator that yields the tokens of the line.
+        """
+        pending = None
+        for match in _TOKEN_RE.finditer(self._body):
+            number, string, keyword, text = match.groups()
+            if text is not None:
+                pending = zx_decode_basic_string(text) if pending is None else pending + zx_decode_basic_string(text)
+                continue
+            if number is not None:
+                # The number's text is at the end of the preceding characters. DEF FN parameters are followed by
+                # a placeholder without any literal so the token text is empty.
+                literal = _LITERAL_RE.search(pending) if pending else None
+                if literal:
+                    pending, literal = pending[:literal.start()], literal.group()
+                if pending:
+                    yield Token('text', None, pending, None)
+                pending = None
+                yield Token('number', None, literal or "", zx_decode_number(number[1:]))
+                continue
+            if pending:
+                yield Token('text', None, pending, None)
+            pending = None
+            if string is not None:
+                yield Token('string', None, zx_decode_basic_string(string), None)
+            else:
+                code = keyword[0]
+                yield Token('keyword', code, ZX_CHAR_MAP[code].rstrip(" "), None)
+                if code == _TOKEN_REM:
+                    rest = self._body[match.end():]
+                    if rest:
+                        yield Token('rem', None, zx_decode_basic_string(rest), None)
+                    return
+        if pending:
+            yield Token('text', None, pending, None)
+
+    def numbers(self):
+        """
+        Returns the list of decoded numbers in the line.
+        """
+        return [token.value for token in self.tokens() if token.kind == 'number']
+
+class BasicProgram:
+    """
+    Random-access view of a tokenized Basic program. Any variables area following the program is ignored.
+    """
+    def __init__(self, data):
+        self._data = data
+        self._numbers = None
+        self._offsets = None
+        self._sorted = True
+
+    def _build_index(self):
+        """
+        Scan the line framing once and record the number and offset of every line.
+        """
+        numbers = list()
+        offsets = list()
+        data = self._data
+        pos = 0
+        while pos + 4 <= len(data):
+            line_num = struct.unpack_from('>H', data, pos)[0]
+            if line_num > MAX_LINE_NUMBER:
+                break
+            numbers.append(line_num)
+            offsets.append(pos)
+            pos += 4 + struct.unpack_from('<H', data, pos + 2)[0]
+        self._numbers = numbers
+        self._offsets = offsets
+        self._sorted = all(a < b for a, b in zip(numbers, numbers[1:]))
+
+    def _index(self):
+        if self._numbers is None:
+            self._build_index()
+        return self._numbers, self._offsets
+
+    def _line_at(self, i):
+        numbers, offsets = self._index()
+        offset = offsets[i]
+        length = struct.unpack_from('<H', self._data, offset + 2)[0]
+        body = bytes(self._data[offset + 4:offset + 4 + length])
+        if body.endswith(b'\x0d'):
+            body = body[:-1]
+        return BasicLine(numbers[i], offset, body)
+
+    def __len__(self):
+        return len(self._index()[0])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self._line_at(i)
+
+    @property
+    def line_numbers(self):
+        """
+        Returns the list of line numbers in program order.
+        """
+        return list(self._index()[0])
+
+    def line(self, number):
+        """
+        Returns the line with the given line number. Raises KeyError if there isn't one.
+        """
+        numbers, _ = self._index()
+        if self._sorted:
+            i = bisect.bisect_left(numbers, number)
+            if i < len(numbers) and numbers[i] == number:
+                return self._line_at(i)
+        elif number in numbers:
+            # Line numbers have been tampered with (e.g. by a protection scheme) so fall back to a scan
+            return self._line_at(numbers.index(number))
+        raise KeyError("Line {} is not in the program".format(number))
+
+    def lines(self, first=0, last=MAX_LINE_NUMBER):
+        """
+        Generator that yields the lines numbered from first to last inclusive.
+        """
+        numbers, _ = self._index()
+        if not self._sorted:
+            for i, number in enumerate(numbers):
+                if first <= number <= last:
+                    yield self._line_at(i)
+            return
+        for i in range(bisect.bisect_left(numbers, first), bisect.bisect_right(numbers, last)):
+            yield self._line_at(i)
+
+    @property
+    def listing(self):
+        """
+        Returns the whole program as text.
+        """
+        return "\n".join(line.text for line in self)
@@ -6,6 +6,29 @@ Define the type of file blocks that can be handled by the ZX utilities.
 
 import struct
 
+def calc_checksum(data):
+    """
+    Returns the tape checksum (XOR of every byte) of data, which should include the flag byte.
+    """
+    if not data:
+        return 0
+    value = int.from_bytes(data, 'little')
+    checksum = 0
+    while value:
+        checksum ^= value & 0xffffffffffffffff
+        value >>= 64
+    checksum ^= checksum >> 32
+    checksum ^= checksum >> 16
+    checksum ^= checksum >> 8
+    return checksum & 0xff
+
+def standard_timing(flag):
+    """
+    Returns the ROM loader timing tuple (pilot, sync1, sync2, zero, one, pilot tone length, used bits) in T-states
+    for a block with the given flag byte. Headers have a longer pilot tone than data blocks.
+    """
+    return (2168, 667, 735, 855, 1710, 8063 if flag < 128 else 3223, 8)
+
 class Block:
     """
     Base class for all blocks.
@@ -43,6 +66,13 @@ class Block:
         """
         return 0
 
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        return {"id": self._id, "type": self.typedesc, "size": self.size}
+
 class Header(Block):
     """
     Class for holding header information.
@@ -66,6 +96,15 @@ class Header(Block):
         """
         return (self._version_major, self._version_minor)
 
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(Header, self).record
+        record["version"] = "{:d}.{:02d}".format(self._version_major, self._version_minor)
+        return record
+
 class DataBlockAscii(Block):
     """
     Class for holding ASCII data blocks.
@@ -81,6 +120,13 @@ class DataBlockAscii(Block):
         """
         return self._text
 
+    @property
+    def text(self):
+        """
+        Returns the text held in this block.
+        """
+        return self._text
+
     @property
     def typedesc(self):
         """
@@ -89,6 +135,39 @@ class DataBlockAscii(Block):
         # Override base class to add size of text
         return "{} (size {} bytes)".format(super(DataBlockAscii, self).typedesc, len(self._text))
 
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(DataBlockAscii, self).record
+        record["text"] = self._text
+        return record
+
+class DataBlockPause(DataBlockAscii):
+    """
+    Class for holding a pause (or stop the tape) command.
+    """
+    def __init__(self, blockid, typedesc, pause):
+        super(DataBlockPause, self).__init__(blockid, typedesc, "Pause: {} ms".format(pause))
+        self._pause = pause
+
+    @property
+    def pause(self):
+        """
+        Returns the length of the pause in milliseconds (0 means stop the tape).
+        """
+        return self._pause
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(DataBlockPause, self).record
+        record["pause"] = self._pause
+        return record
+
 class DataBlockArchive(Block):
     """
     Class for holding archive description block.
@@ -110,15 +189,74 @@ class DataBlockArchive(Block):
             text += "{}: {}\n".format(typedesc[typeid], message)
         return text.rstrip()
 
+    @property
+    def descriptions(self):
+        """
+        Returns the list of (type id, text) tuples held in this block.
+        """
+        return self._messages
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(DataBlockArchive, self).record
+        record["descriptions"] = [{"type": typeid, "text": text} for typeid, text in self._messages]
+        return record
+
+class DataBlockRaw(Block):
+    """
+    Class for holding a block that is not decoded (e.g. a TZX pure tone or group block), kept as its raw bytes so
+    that it can be copied through unchanged.
+    """
+    def __init__(self, blockid, typedesc, data):
+        super(DataBlockRaw, self).__init__(blockid, typedesc)
+        self._data = data
+
+    @property
+    def data(self):
+        """
+        Returns the bytes of the block following its ID.
+        """
+        return self._data
+
+    @property
+    def size(self):
+        """
+        Returns the size of the data block.
+        """
+        return len(self._data)
+
+    @property
+    def typedesc(self):
+        """
+        The type description.
+        """
+        # Override base class to add size of data
+        return "{} (size {} bytes)".format(super(DataBlockRaw, self).typedesc, len(self._data))
+
+    @property
+    def dump(self):
+        """
+        Return a printable dump string to display on stdout.
+        """
+        return self._data.hex(" ")
+
 class DataBlockBinary(Block):
     """
     Class for holding binary data blocks.
+
+    The pause (in milliseconds) after the block and, for turbo blocks, the timing tuple of (pilot, sync1, sync2,
+    zero, one, pilot tone length, used bits) are kept so that the block can be written back out faithfully.
     """
-    def __init__(self, blockid, typedesc, data):
+    def __init__(self, blockid, typedesc, data, pause=None, timing=None):
         super(DataBlockBinary, self).__init__(blockid, typedesc)
         self._flag = data[0]
         self._data = data[1:-1]
         self._checksum = data[-1]
+        self._pause = pause
+        self._timing = timing
 
     @property
     def dump(self):
@@ -158,13 +296,69 @@ class DataBlockBinary(Block):
         """
         return len(self._data)
 
+    @property
+    def flag(self):
+        """
+        Returns the flag byte of this block.
+        """
+        return self._flag
+
+    @property
+    def checksum(self):
+        """
+        Returns the checksum byte stored with this block.
+        """
+        return self._checksum
+
+    @property
+    def checksum_ok(self):
+        """
+        Does the stored checksum match the data?
+        """
+        return calc_checksum(bytes([self._flag]) + self._data) == self._checksum
+
+    @property
+    def raw(self):
+        """
+        Returns the block as it is stored on tape (flag, data and checksum).
+        """
+        return bytes([self._flag]) + self._data + bytes([self._checksum])
+
+    @property
+    def pause(self):
+        """
+        Returns the pause after this block in milliseconds (None if the source format did not specify one).
+        """
+        return self._pause
+
+    @property
+    def timing(self):
+        """
+        Returns the turbo timing tuple of this block (None if it uses the standard ROM timings).
+        """
+        return self._timing
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(DataBlockBinary, self).record
+        record.update({"flag": self._flag, "checksum": self._checksum, "checksum_ok": self.checksum_ok,
+                       "pause": self._pause})
+        if self._timing:
+            record["timing"] = dict(zip(("pilot", "sync1", "sync2", "zero", "one", "pilot_tone", "used_bits"),
+                                        self._timing))
+        return record
+
 class DataBlockProgram(DataBlockBinary):
     """
     Class for holding binary data block that contains program data.
     """
-    def __init__(self, blockid, typedesc, data):
-        super(DataBlockProgram, self).__init__(blockid, typedesc, data)
-        self._program = self._data.decode('zxbasic')
+    def __init__(self, blockid, typedesc, data, pause=None, timing=None):
+        super(DataBlockProgram, self).__init__(blockid, typedesc, data, pause, timing)
+        self._listing = None
+        self._program = None
 
     @property
     def typedesc(self):
@@ -179,14 +373,28 @@ class DataBlockProgram(DataBlockBinary):
         """
         Return a printable dump string to display on stdout.
         """
+        if self._listing is None:
+            self._listing = self._data.decode('zxbasic')
+        return self._listing
+
+    @property
+    def program(self):
+        """
+        Returns a structured view of the program for random access to its lines and tokens. It is created on
+        first use and kept, so its line index is only built once.
+        """
+        if self._program is None:
+            from zxutils.basic import BasicProgram # pylint: disable=import-outside-toplevel
+
+            self._program = BasicProgram(self._data)
         return self._program
 
 class TapeHeader(DataBlockBinary):
     """
     Class for managing a specialized binary data block that has been identified as a header block.
     """
-    def __init__(self, blockid, typedesc, data):
-        super(TapeHeader, self).__init__(blockid, typedesc, data)
+    def __init__(self, blockid, typedesc, data, pause=None, timing=None):
+        super(TapeHeader, self).__init__(blockid, typedesc, data, pause, timing)
 
         block_desc = {0: "Program", 1: "Number array", 2: "Character array", 3: "Code file"}
         self._block_type, filename, self._length, self._param1, self._param2 = struct.unpack_from('=B10sHHH',
@@ -208,6 +416,13 @@ class TapeHeader(DataBlockBinary):
         """
         return bool(self._block_type == 3)
 
+    @property
+    def filename(self):
+        """
+        Returns the filename held in this header.
+        """
+        return self._filename
+
     @property
     def parameter1(self):
         """
@@ -235,3 +450,89 @@ class TapeHeader(DataBlockBinary):
                 self._flag, self._block_desc, self._filename, self._length, self._param1, self._param1, param1_desc,
                 self._param2, self._param2, param2_desc, self._checksum, super(TapeHeader, self).dump)
         return desc
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(TapeHeader, self).record
+        record["header"] = {"block_type": self._block_desc, "filename": self._filename, "length": self._length,
+                            "parameter1": self._param1, "parameter2": self._param2}
+        return record
+
+class SnapshotRegisters(Block):
+    """
+    Class for holding the machine state (registers and hardware settings) of a snapshot.
+    """
+    def __init__(self, blockid, typedesc, registers):
+        super(SnapshotRegisters, self).__init__(blockid, typedesc)
+        self._registers = registers
+
+    @property
+    def registers(self):
+        """
+        Returns the dictionary of register names to values.
+        """
+        return self._registers
+
+    @property
+    def dump(self):
+        """
+        Return a printable dump string to display on stdout.
+        """
+        return "\n".join("{} : 0x{:04X} ({})".format(name, value, value) for name, value in self._registers.items())
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(SnapshotRegisters, self).record
+        record["registers"] = self._registers
+        return record
+
+class DataBlockMemory(DataBlockBinary):
+    """
+    Class for holding a 16K page of memory from a snapshot. Memory has no flag byte or checksum on tape so the
+    block is given the 0xFF data flag and a calculated checksum.
+    """
+    def __init__(self, blockid, typedesc, data, address=None, bank=None):
+        data = bytes(data)
+        super(DataBlockMemory, self).__init__(blockid, typedesc, b'\xff' + data + bytes([calc_checksum(data) ^ 0xff]))
+        self._address = address
+        self._bank = bank
+
+    @property
+    def address(self):
+        """
+        Returns the address the page is mapped at (None if the bank is not paged in).
+        """
+        return self._address
+
+    @property
+    def bank(self):
+        """
+        Returns the 128K RAM bank number (None for 48K snapshots).
+        """
+        return self._bank
+
+    @property
+    def typedesc(self):
+        """
+        The type description.
+        """
+        # Override base class to add where the memory lives
+        where = "" if self._bank is None else " bank {}".format(self._bank)
+        if self._address is not None:
+            where += " at 0x{:04X}".format(self._address)
+        return "{}{} (size {} bytes)".format(super(DataBlockBinary, self).typedesc, where, len(self._data))
+
+    @property
+    def record(self):
+        """
+        Returns the fields of this block as a dictionary suitable for JSON output.
+        """
+        record = super(DataBlockMemory, self).record
+        record.update({"address": self._address, "bank": self._bank})
+        return record
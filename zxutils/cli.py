@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Command line interface for the ZX utilities (run with `python -m zxutils`).
+
+Each subcommand imports what it needs when it runs, so quick commands such as list never load the audio, image
+or server code.
+"""
+
+import argparse
+import os
+import sys
+
+def _open(path):
+    """
+    Returns a handler for the file at path.
+    """
+    from zxutils.handlers import handler_for, load_file # pylint: disable=import-outside-toplevel
+
+    filename, data = load_file(path)
+    return handler_for(filename, data)
+
+def parse_selection(text):
+    """
+    Converts a comma separated list of block indices and ranges (e.g. 0,2-5) into a set of indices.
+    """
+    selection = set()
+    for item in text.split(","):
+        first, _, last = item.strip().partition("-")
+        selection.update(range(int(first), int(last or first) + 1))
+    return selection
+
+def write_ndjson(processor, block_idx=None, dump=False, payload=False):
+    """
+    Write the blocks of a file to stdout as NDJSON. A reader that stops early (e.g. head) closes the pipe, which
+    ends the output quietly rather than with a traceback.
+    """
+    try:
+        processor.write_ndjson(sys.stdout, block_idx, dump, payload)
+    except BrokenPipeError:
+        # Python flushes stdout again on exit, so point it at devnull to stop that raising as well
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+
+def _list(args):
+    processor = _open(args.file)
+    if args.json:
+        write_ndjson(processor, payload=args.payload)
+        return
+    processor.process()
+    processor.summarize()
+
+def _dump(args):
+    processor = _open(args.file)
+    if args.json:
+        write_ndjson(processor, args.block, dump=True, payload=args.payload)
+        return
+    processor.process()
+    processor.dump(args.block)
+
+def _extract(args):
+    processor = _open(args.file)
+    processor.process()
+    for extract_type in [x.strip() for x in args.types.split(",")]:
+        if extract_type == 'png':
+            processor.decode_to_png(args.prefix, args.block)
+        elif extract_type == 'txt':
+            processor.decode_to_txt(args.prefix, args.block)
+        elif extract_type == 'bin':
+            processor.decode_to_bin(args.prefix, args.block)
+
+def _screens(args):
+    processor = _open(args.file)
+    processor.process()
+    for i, offset, size, score in processor.find_screens(args.block, args.threshold):
+        print("Block: {:4d} - offset 0x{:04X} ({} bytes) score {:.2f}".format(i, offset, size, score))
+
+def _rip(args):
+    from zxutils.graphics import TileLayout # pylint: disable=import-outside-toplevel
+
+    processor = _open(args.file)
+    processor.process()
+    layout = TileLayout(args.width, args.height, args.stride, args.order, args.lsb, args.columns, args.gap)
+    strides = None
+    if args.sweep:
+        first, _, last = args.sweep.partition("-")
+        strides = range(int(first), int(last or first) + 1)
+    try:
+        written = processor.decode_to_gfx(args.prefix, layout, args.block, args.offset, args.length, strides,
+                                          args.scale)
+    except ValueError as error:
+        sys.exit("Error: {}".format(error))
+    for i, filename, panels in written:
+        print("Block: {:4d} - {}".format(i, filename))
+        if strides:
+            print("  " + ", ".join("stride {} at x={}".format(stride, x) for stride, x in panels))
+
+def _convert(args):
+    from zxutils.writers import writer_for # pylint: disable=import-outside-toplevel
+
+    processor = _open(args.file)
+    select = parse_selection(args.select) if args.select else None
+    with open(args.outfile, "wb") as f:
+        writer = writer_for(args.outfile, f, args.fix_checksums)
+        writer.write_blocks(processor.iter_blocks(), select)
+    if processor.truncated:
+        sys.exit("Error: {} could not be read to the end so {} is incomplete".format(args.file, args.outfile))
+
+def _wav(args):
+    from zxutils.audio import write_wav # pylint: disable=import-outside-toplevel
+
+    processor = _open(args.file)
+    write_wav(processor.iter_blocks(), args.outfile, args.rate)
+
+def _disasm(args):
+    from zxutils.disasm import Emulator # pylint: disable=import-outside-toplevel
+    from zxutils.handlers import SnapshotHandler # pylint: disable=import-outside-toplevel
+
+    processor = _open(args.file) if args.file.lower().endswith((".sna", ".z80")) else None
+    if isinstance(processor, SnapshotHandler):
+        # Load the snapshot's RAM above the ROM and start from its registers
+        processor.process()
+        Emulator(args.file, 0x4000, processor.registers["PC"], args.addrsize, processor.memory, processor.registers)
+    else:
+        Emulator(args.file, args.origin, args.pc, args.addrsize)
+
+def _index(args):
+    from zxutils.search import SearchIndex # pylint: disable=import-outside-toplevel
+
+    with SearchIndex(args.index) as index:
+        stats = index.update(args.paths)
+        for path, error in stats["errors"]:
+            print("Skipped {}: {}".format(path, error), file=sys.stderr)
+        print("Indexed {} files ({} unchanged, {} removed, {} skipped). Index holds {files} files, {documents} "
+              "entries and {terms} terms.".format(stats["indexed"], stats["unchanged"], stats["removed"],
+                                                  len(stats["errors"]), **index.stats))
+
+def _query(args):
+    from zxutils.search import SearchIndex # pylint: disable=import-outside-toplevel
+
+    with SearchIndex(args.index) as index:
+        for hit in index.query(" ".join(args.query), args.kind, args.limit):
+            location = "block {}".format(hit.block) if hit.line is None else \
+                "block {} line {}".format(hit.block, hit.line)
+            print("{}: {} ({}): {}".format(hit.path, location, hit.kind, hit.text))
+
+def _serve(args):
+    import asyncio # pylint: disable=import-outside-toplevel
+    from zxutils.server import serve # pylint: disable=import-outside-toplevel
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket, args.workers, args.max_concurrent))
+    except KeyboardInterrupt:
+        pass
+
+def _build_parser():
+    parser = argparse.ArgumentParser(prog='zxutils', description='Utilities for processing ZX Spectrum files.')
+    commands = parser.add_subparsers(dest='command', metavar='COMMAND')
+    commands.required = True
+
+    def add_command(name, func, help_text, needs_file=True):
+        command = commands.add_parser(name, help=help_text, description=help_text)
+        command.set_defaults(func=func)
+        if needs_file:
+            command.add_argument('file', metavar='FILE', type=str,
+                                 help='ZX Spectrum file to process (supports TZX/TAP/WAV/SNA/Z80/ZIP only).')
+        return command
+
+    def add_json_options(command):
+        command.add_argument('--json', action='store_true', help='Write one JSON object per block (NDJSON) as each '
+                             'block is parsed.')
+        command.add_argument('--payload', action='store_true', help='Include the base64 encoded block data in the '
+                             'JSON output.')
+
+    command = add_command('list', _list, 'Output list of blocks to screen.')
+    add_json_options(command)
+
+    command = add_command('dump', _dump, 'Dump blocks to screen.')
+    command.add_argument('--block', metavar='BLOCKID', type=int, help='Process a specific block ID.')
+    add_json_options(command)
+
+    command = add_command('extract', _extract, 'Extract the content of blocks to files.')
+    command.add_argument('types', metavar='LIST', type=str, help='Comma separated list of types to extract from '
+                         'block(s). Valid types are: png, txt and bin (e.g png,txt).')
+    command.add_argument('--block', metavar='BLOCKID', type=int, help='Process a specific block ID.')
+    command.add_argument('--prefix', metavar='FILE_PREFIX', type=str, default='block',
+                         help='File prefix to use when writing out blocks')
+
+    command = add_command('screens', _screens, 'Scan binary blocks for headerless screens.')
+    command.add_argument('--block', metavar='BLOCKID', type=int, help='Process a specific block ID.')
+    command.add_argument('--threshold', type=float, default=0.5, help='Minimum confidence score to report.')
+
+    command = add_command('rip', _rip, 'Render binary blocks as tiled 1-bit graphics (fonts, UDGs and sprites).')
+    command.add_argument('--block', metavar='BLOCKID', type=int, help='Process a specific block ID.')
+    command.add_argument('--offset', type=int, default=0, help='Offset of the first byte to render in each block.')
+    command.add_argument('--length', type=int, help='Number of bytes to render (defaults to the rest of the block).')
+    command.add_argument('--width', type=int, default=1, help='Tile width in bytes.')
+    command.add_argument('--height', type=int, default=8, help='Tile height in pixel rows.')
+    command.add_argument('--stride', type=int, help='Bytes between source rows (row order) or columns (column '
+                         'order). Defaults to the tile width or height, larger values treat the data as a sheet.')
+    command.add_argument('--order', type=str, choices=('row', 'column'), default='row',
+                         help='Whether tile bytes run across then down (row) or down then across (column).')
+    command.add_argument('--lsb', action='store_true', help='The leftmost pixel is the least significant bit.')
+    command.add_argument('--columns', type=int, default=16, help='Number of tiles per row of the image.')
+    command.add_argument('--gap', type=int, default=1, help='Space in bytes left between tiles.')
+    command.add_argument('--sweep', metavar='FIRST-LAST', type=str, help='Render once for every stride in a range '
+                         'and place the results side by side in one atlas (e.g. --sweep 1-32).')
+    command.add_argument('--scale', type=int, default=2, help='Scale factor for the image.')
+    command.add_argument('--prefix', metavar='FILE_PREFIX', type=str, default='block',
+                         help='File prefix to use when writing out images.')
+
+    command = add_command('convert', _convert, 'Convert to a TAP or TZX file (chosen by extension).')
+    command.add_argument('outfile', metavar='OUTFILE', type=str, help='File to write.')
+    command.add_argument('--select', metavar='LIST', type=str, help='Comma separated list of block IDs or ranges '
+                         'to write (e.g. --select 0,2-5).')
+    command.add_argument('--fix-checksums', action='store_true', help='Recalculate checksums.')
+
+    command = add_command('wav', _wav, 'Render the tape as audio to a WAV file.')
+    command.add_argument('outfile', metavar='OUTFILE', type=str, help='File to write.')
+    command.add_argument('--rate', metavar='HZ', type=int, default=44100, help='Sample rate.')
+
+    command = add_command('disasm', _disasm, 'Disassemble a Z80 binary file or snapshot (.SNA/.Z80).')
+    command.add_argument('--origin', metavar='ORIGIN', type=int, default=0, help='Start address to load binary data.')
+    command.add_argument('--pc', metavar='PC', type=int, default=0, help='Initial PC address to begin disassembling.')
+    command.add_argument('--addrsize', metavar='SIZE', type=int, default=65536, help='The size of the address space.')
+
+    command = add_command('index', _index, 'Add tapes to a search index (only changed files are reparsed).',
+                          needs_file=False)
+    command.add_argument('index', metavar='INDEX', type=str, help='Search index database file.')
+    command.add_argument('paths', metavar='PATH', type=str, nargs='+', help='Tape files or directories to index.')
+
+    command = add_command('query', _query, 'Search the index for Basic lines, tape filenames and text blocks.',
+                          needs_file=False)
+    command.add_argument('index', metavar='INDEX', type=str, help='Search index database file.')
+    command.add_argument('query', metavar='QUERY', type=str, nargs='+', help='Words that must all appear, or '
+                         '"quoted phrases" (e.g. POKE 23606 or \'"RANDOMIZE USR"\').')
+    command.add_argument('--kind', type=str, choices=('program', 'header', 'archive', 'text'),
+                         help='Only search one kind of text.')
+    command.add_argument('--limit', type=int, default=100, help='Maximum number of results.')
+
+    command = add_command('serve', _serve, 'Run the resident worker service.', needs_file=False)
+    command.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    command.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    command.add_argument('--socket', metavar='PATH', type=str, help='Listen on a Unix domain socket instead of TCP.')
+    command.add_argument('--workers', type=int, help='Number of worker processes (defaults to the CPU count).')
+    command.add_argument('--max-concurrent', type=int, default=8, help='Maximum number of requests processed at '
+                         'once.')
+    return parser
+
+def main(argv=None):
+    """
+    Parse the command line and run the selected subcommand.
+    """
+    args = _build_parser().parse_args(argv)
+    args.func(args)
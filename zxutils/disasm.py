@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Z80 disassembler
+"""
+
+import array
+import os
+
+class Emulator:
+    """
+    This class describes the virtual z80 platform.
+    """
+    def __init__(self, filename, origin, pc, max_size, data=None, registers=None):
+        # Create memory and load binary data into it (from the file unless the data has been given)
+        self.memory = array.array('B', [0] * origin)
+        if data is None:
+            file_size = os.stat(filename).st_size
+            with open(filename, mode='rb') as file:
+                self.memory.fromfile(file, file_size)
+        else:
+            self.memory.frombytes(bytes(data))
+        self.pc = pc
+        self.registers = registers
+
+        # Extend memory to cover maximum size
+        if len(self.memory) < max_size:
+            self.memory.extend([0] * (max_size - len(self.memory)))
+        print(len(self.memory))
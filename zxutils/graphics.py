@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Renders arbitrary binary data as tiled 1-bit graphics, for ripping fonts, UDGs and sprites out of CODE blocks.
+
+Graphics are usually stored either as a run of small tiles (e.g. 8 bytes per font character) or as a sheet of
+fixed width bitmap rows, with the bytes of each tile running across then down (row order) or down then across
+(column order). The layout is rebuilt with strided slices of the data rather than per-pixel Python code: the
+tiles are first gathered into a contiguous row ordered array, which is then scattered into the packed image a
+whole row of tiles at a time.
+"""
+
+import collections
+
+# A packed 1-bit image, most significant bit first with each row padded to a whole number of bytes. A set bit is
+# ink.
+Bitmap = collections.namedtuple('Bitmap', ['width', 'height', 'data'])
+
+# Translation table that reverses the order of the bits in a byte.
+_REVERSE_BITS = bytes(int("{:08b}".format(i)[::-1], 2) for i in range(256))
+
+class TileLayout:
+    """
+    Class describing how tiles are laid out in the data and how they are arranged in the rendered image.
+
+    width is the tile width in bytes and height its height in pixel rows. stride is the distance in bytes between
+    consecutive rows (row order) or columns (column order) of the source, which defaults to the size of a single
+    tile row or column so that tiles follow one another. A larger stride treats the data as a sheet of tiles. lsb
+    is set when the leftmost pixel of a byte is its least significant bit. Tiles are placed columns to a row
+    (unless the stride describes a sheet, in which case the sheet's own layout is kept) with gap bytes of paper
+    between them.
+    """
+    def __init__(self, width=1, height=8, stride=None, order='row', lsb=False, columns=16, gap=1):
+        if width < 1 or height < 1:
+            raise ValueError("Tiles must be at least 1 byte wide and 1 row high")
+        if order not in ('row', 'column'):
+            raise ValueError("Unknown byte order: {}".format(order))
+        self._width = width
+        self._height = height
+        self._stride = stride
+        self._order = order
+        self._lsb = lsb
+        self._columns = columns
+        self._gap = gap
+
+    @property
+    def width(self):
+        """
+        Returns the tile width in bytes.
+        """
+        return self._width
+
+    @property
+    def height(self):
+        """
+        Returns the tile height in pixel rows.
+        """
+        return self._height
+
+    @property
+    def stride(self):
+        """
+        Returns the distance in bytes between consecutive rows (row order) or columns (column order) of the source.
+        """
+        if self._stride is None:
+            return self._width if self._order == 'row' else self._height
+        return self._stride
+
+    def _steps(self, stride):
+        """
+        Returns the byte steps (between rows, between columns, between tiles in a band, between bands) and the
+        number of tiles in each band of the source.
+        """
+        if self._order == 'row':
+            if stride < self._width:
+                raise ValueError("The stride must be at least the tile width in row order")
+            return stride, 1, self._width, stride * self._height, stride // self._width
+        if stride < self._height:
+            raise ValueError("The stride must be at least the tile height in column order")
+        return 1, stride, self._height, stride * self._width, stride // self._height
+
+    def tiles(self, data, stride=None):
+        """
+        Returns (count, tiles) where tiles holds every tile in the data one after another, each stored row by row.
+        """
+        stride = self.stride if stride is None else stride
+        row_step, col_step, tile_step, band_step, per_band = self._steps(stride)
+        width, height = self._width, self._height
+        tile_size = width * height
+
+        data = bytes(data)
+        if self._lsb:
+            data = data.translate(_REVERSE_BITS)
+        length = len(data)
+        bands = max(1, -(-length // band_step))
+        data += bytes(bands * band_step - length)
+
+        # Each (tile in band, row, byte) position is a single strided slice across every band
+        tiles = bytearray(bands * per_band * tile_size)
+        for tile in range(per_band):
+            for row in range(height):
+                for col in range(width):
+                    start = tile * tile_step + row * row_step + col * col_step
+                    tiles[tile * tile_size + row * width + col::per_band * tile_size] = data[start::band_step]
+
+        # Drop the tiles in the padding after the end of the data
+        used = length - (bands - 1) * band_step
+        count = (bands - 1) * per_band + len(range(0, min(used, per_band * tile_step), tile_step))
+        return count, tiles[:count * tile_size]
+
+    def render(self, data, stride=None):
+        """
+        Returns a Bitmap of the tiles in the data.
+        """
+        stride = self.stride if stride is None else stride
+        count, tiles = self.tiles(data, stride)
+        per_band = self._steps(stride)[4]
+        columns = per_band if per_band > 1 else self._columns
+        columns = max(1, min(columns, count))
+        rows = -(-count // columns)
+
+        width, height = self._width, self._height
+        tile_size = width * height
+        cell_width = width + self._gap
+        cell_height = height + 8 * self._gap
+        pitch = columns * cell_width
+        tiles += bytes(rows * columns * tile_size - len(tiles))
+
+        # Scatter each row of tiles into the image, one (row, byte) position of every tile in the row at a time
+        image = bytearray(pitch * rows * cell_height)
+        for tile_row in range(rows):
+            first = tile_row * columns * tile_size
+            band = tiles[first:first + columns * tile_size]
+            for row in range(height):
+                base = (tile_row * cell_height + row) * pitch
+                for col in range(width):
+                    image[base + col:base + pitch:cell_width] = band[row * width + col::tile_size]
+        return Bitmap(pitch * 8, rows * cell_height, bytes(image))
+
+    def sweep(self, data, strides):
+        """
+        Render the data once per stride and place the results side by side (in stride order) in one image, so that
+        the stride a sheet was drawn with stands out. Strides smaller than a tile row (row order) or column
+        (column order) can't hold a tile and are skipped. Returns the Bitmap and a (stride, x position) tuple for
+        each panel rendered.
+        """
+        smallest = self._width if self._order == 'row' else self._height
+        strides = [stride for stride in strides if stride >= smallest]
+        if not strides:
+            raise ValueError("No stride in the sweep is at least the tile {} ({})".format(
+                "width" if self._order == 'row' else "height", smallest))
+        panels = [self.render(data, stride) for stride in strides]
+        gap = max(1, self._gap)
+        pitch = sum(panel.width // 8 + gap for panel in panels)
+        height = max(panel.height for panel in panels)
+
+        # Copy each byte column of a panel into the image with a single strided slice
+        image = bytearray(pitch * height)
+        positions = list()
+        x = 0
+        for stride, panel in zip(strides, panels):
+            panel_pitch = panel.width // 8
+            positions.append((stride, x * 8))
+            for col in range(panel_pitch):
+                image[x + col:x + col + panel.height * pitch:pitch] = panel.data[col::panel_pitch]
+            x += panel_pitch + gap
+        return Bitmap(pitch * 8, height, bytes(image)), positions
@@ -4,11 +4,18 @@
 Contains all the ZX file handler classes.
 """
 
+import base64
+import io
+import json
+import mmap
 import struct
 import os
+import sys
 
-from zxutils.blocks import Header, DataBlockAscii, DataBlockArchive, DataBlockBinary, DataBlockProgram, TapeHeader
-from zxutils.utils import write_zxscr_to_png
+from zxutils.blocks import Header, DataBlockAscii, DataBlockArchive, DataBlockBinary, DataBlockMemory, DataBlockPause, \
+    DataBlockProgram, DataBlockRaw, SnapshotRegisters, TapeHeader, calc_checksum
+from zxutils.screen import find_screens, screen_data
+from zxutils.utils import write_bitmap_to_png, write_zxscr_to_png, z80_decompress
 
 class Handler:
     """
@@ -18,6 +25,9 @@ class Handler:
         self.data = data
         self.pos = 0
         self.blocks = list()
+        self.block_offset = None
+        self.truncated = False
+        self._last_block = None
 
     @staticmethod
     def can_handle(filename, data):
@@ -30,19 +40,48 @@ class Handler:
         """
         Process the file.
         """
-        pass
+        self.blocks.extend(self.iter_blocks())
+
+    def iter_blocks(self):
+        """
+        Generator that parses the file and yields each block in turn without keeping hold of it.
+        While a block is being handled, block_offset holds its offset within the file (if known). Parsing starts
+        from the beginning of the file every time. If parsing has to stop before the end of the file (e.g. at a
+        block type that isn't understood), truncated is set.
+        """
+        return iter(())
 
     def summarize(self):
         """
-        Print summary of contents.
+        Summarize the contents of each block to stdout.
         """
-        pass
+        for i, block in enumerate(self.blocks):
+            print("Block: {:4d} ({}) - {}".format(i, block.idstr, block.typedesc))
 
     def dump(self, block_idx=None):
         """
-        Dump content of blocks to stdout (or a single block).
+        Output to stdout, the content of each block.
+        """
+        for i, block in enumerate(self.blocks):
+            if i == block_idx or block_idx is None:
+                print("Block: {:4d} ({})".format(i, block.idstr))
+                print(block.dump)
+
+    def write_ndjson(self, file, block_idx=None, dump=False, payload=False):
         """
-        pass
+        Parse the file and write one JSON object per block (newline delimited) as each block is read. The dump
+        text and the base64 encoded block data can be included. Each record is flushed as soon as it is written.
+        """
+        for i, block in enumerate(self.iter_blocks()):
+            if i == block_idx or block_idx is None:
+                record = {"index": i, "offset": self.block_offset}
+                record.update(block.record)
+                if dump:
+                    record["dump"] = block.dump
+                if payload and isinstance(block, DataBlockBinary):
+                    record["payload"] = base64.b64encode(block.raw).decode('ascii')
+                file.write(json.dumps(record) + "\n")
+                file.flush()
 
     def decode_to_bin(self, file_prefix, block_idx=None):
         """
@@ -68,9 +107,24 @@ class Handler:
                     with open(filename, "w") as file_txt:
                         file_txt.write(block.dump)
 
+    def find_screens(self, block_idx=None, threshold=0.5):
+        """
+        Scan binary blocks for headerless screens. Returns a list of (block index, offset, size, score) tuples.
+        """
+        screens = list()
+        for i, block in enumerate(self.blocks):
+            if i == block_idx or block_idx is None:
+                if isinstance(block, DataBlockBinary) and not isinstance(block, (TapeHeader, DataBlockProgram)):
+                    for offset, size, score in find_screens(block.data, threshold=threshold):
+                        screens.append((i, offset, size, score))
+        return screens
+
     def decode_to_png(self, file_prefix, block_idx=None):
         """
         Try to interpret binary as image data if it is data written to the screen memory.
+
+        Blocks that are not described by a header pointing at screen memory (e.g. those loaded by turbo or
+        headerless loaders) are scanned for screens and the most likely one is written out.
         """
         last_header = None
         for i, block in enumerate(self.blocks):
@@ -79,9 +133,38 @@ class Handler:
                 if last_header and last_header.is_code and last_header.parameter1 == 16384 and block.size >= 6912:
                     filename = "{}_{:03d}.png".format(file_prefix, i)
                     write_zxscr_to_png(filename, block.data)
-                    last_header = None
-                if isinstance(block, TapeHeader):
-                    last_header = block
+                elif isinstance(block, DataBlockBinary) and not isinstance(block, (TapeHeader, DataBlockProgram)):
+                    screens = find_screens(block.data)
+                    if screens:
+                        offset, size, _ = screens[0]
+                        filename = "{}_{:03d}.png".format(file_prefix, i)
+                        write_zxscr_to_png(filename, screen_data(block.data, offset, size))
+            last_header = block if isinstance(block, TapeHeader) else None
+
+    def decode_to_gfx(self, file_prefix, layout, block_idx=None, offset=0, length=None, strides=None, scale=1):
+        """
+        Render binary blocks (or the byte range offset to offset + length of them) as tiled graphics using a
+        TileLayout. If strides is given, each block is rendered once per stride into a single atlas. Returns a
+        list of (block index, filename, panels) tuples for the images written, where panels lists the (stride,
+        x position) of each stride rendered.
+        """
+        written = list()
+        for i, block in enumerate(self.blocks):
+            if i == block_idx or (block_idx is None and not isinstance(block, (TapeHeader, DataBlockProgram))):
+                if not isinstance(block, DataBlockBinary):
+                    continue
+                data = block.data[offset:None if length is None else offset + length]
+                if not data:
+                    continue
+                filename = "{}_{:03d}_gfx.png".format(file_prefix, i)
+                if strides:
+                    bitmap, positions = layout.sweep(data, strides)
+                else:
+                    bitmap, positions = layout.render(data), [(layout.stride, 0)]
+                write_bitmap_to_png(filename, bitmap, scale)
+                written.append((i, filename, [(stride, x * scale) for stride, x in positions]))
+        return written
+
 class TZXHandler(Handler):
     """
     Class for handling the processing of TZX files.
@@ -91,29 +174,57 @@ class TZXHandler(Handler):
 
     major_ver, minor_ver = 1, 20
 
+    # Blocks that are kept undecoded, by ID. Each has a description and the layout of its length: a fixed number
+    # of bytes plus a multiple of a little endian count of the given size found at the given offset.
+    RAW_BLOCKS = {
+        0x12: ("Pure Tone", 4, 0, 0, 0),
+        0x13: ("Pulse Sequence", 1, 0, 1, 2),
+        0x14: ("Pure Data Block", 10, 7, 3, 1),
+        0x15: ("Direct Recording", 8, 5, 3, 1),
+        0x18: ("CSW Recording", 4, 0, 4, 1),
+        0x19: ("Generalized Data Block", 4, 0, 4, 1),
+        0x21: ("Group Start", 1, 0, 1, 1),
+        0x22: ("Group End", 0, 0, 0, 0),
+        0x23: ("Jump To Block", 2, 0, 0, 0),
+        0x24: ("Loop Start", 2, 0, 0, 0),
+        0x25: ("Loop End", 0, 0, 0, 0),
+        0x26: ("Call Sequence", 2, 0, 2, 2),
+        0x27: ("Return From Sequence", 0, 0, 0, 0),
+        0x28: ("Select Block", 2, 0, 2, 1),
+        0x2A: ("Stop The Tape If In 48K Mode", 4, 0, 4, 1),
+        0x2B: ("Set Signal Level", 4, 0, 4, 1),
+        0x31: ("Message Block", 2, 1, 1, 1),
+        0x33: ("Hardware Type", 1, 0, 1, 3),
+        0x35: ("Custom Info Block", 20, 16, 4, 1),
+        0x5A: ("Glue Block", 9, 0, 0, 0),
+    }
+
     @staticmethod
     def can_handle(filename, data):
         """
         Returns True if this handler can deal with this file.
         """
-        tzx_header = struct.unpack_from('=7s', data)
-        if tzx_header[0] == b"ZXTape!":
-            return True
-        return False
+        return bytes(data[0:7]) == b"ZXTape!"
 
-    def process(self):
+    def iter_blocks(self):
         """
-        Processes the TZX File.
+        Parses the TZX File, yielding each block as it is read.
         """
+        self.pos = 0
+        self.truncated = False
+        self._last_block = None
+        self.block_offset = self.pos
         header = self._process_header(None, "Header")
         major, minor = header.version
         if major > TZXHandler.major_ver or minor > TZXHandler.minor_ver:
             raise RuntimeError("This script only supports TZX files up to version {}.{:02d}".
                                format(TZXHandler.major_ver, TZXHandler.minor_ver))
 
-        self.blocks.append(header)
+        self._last_block = header
+        yield header
 
         while self.pos < len(self.data):
+            self.block_offset = self.pos
             next_id = struct.unpack_from('=B', self.data, self.pos)[0]
             self.pos += 1
 
@@ -127,27 +238,16 @@ class TZXHandler(Handler):
                 block = self._process_text_description(next_id, "Text Description")
             elif next_id == 0x32:
                 block = self._process_archive_info(next_id, "Archive Info")
+            elif next_id in TZXHandler.RAW_BLOCKS:
+                block = self._process_raw_block(next_id, *TZXHandler.RAW_BLOCKS[next_id])
             else:
-                print("WARNING:Early exit because of unsupported ID: 0x{:02X}".format(next_id))
+                # Warnings go to stderr so they never end up in output such as an NDJSON stream
+                print("WARNING:Early exit because of unsupported ID: 0x{:02X}".format(next_id), file=sys.stderr)
+                self.truncated = True
                 break
 
-            self.blocks.append(block)
-
-    def summarize(self):
-        """
-        Summarize the contents of each block to stdout.
-        """
-        for i, block in enumerate(self.blocks):
-            print("Block: {:4d} ({}) - {}".format(i, block.idstr, block.typedesc))
-
-    def dump(self, block_idx=None):
-        """
-        Output to stdout, the content of each block.
-        """
-        for i, block in enumerate(self.blocks):
-            if i == block_idx or block_idx is None:
-                print("Block: {:4d} ({})".format(i, block.idstr))
-                print(block.dump)
+            self._last_block = block
+            yield block
 
     def _process_header(self, blockid, typedesc):
         signature, end_of_text, major, minor = struct.unpack_from('=7sBBB', self.data, self.pos)
@@ -159,43 +259,43 @@ class TZXHandler(Handler):
     def _process_standard_speed_data(self, blockid, typedesc):
         pause, length = struct.unpack_from('=HH', self.data, self.pos)
         self.pos += 4
-        data = b''.join(struct.unpack_from('={}c'.format(length), self.data, self.pos))
+        data = bytes(self.data[self.pos:self.pos + length])
         is_header = bool(length == 19 and data[0] == 0x00)
         self.pos += length
         if is_header:
-            return TapeHeader(blockid, typedesc, data)
+            return TapeHeader(blockid, typedesc, data, pause)
 
-        # If not header, query last block appended. If this is a header, then check what type
+        # If not header, query last block parsed. If this is a header, then check what type
         # of block this is.
-        if self.blocks and isinstance(self.blocks[-1], TapeHeader) and self.blocks[-1].is_program:
-            return DataBlockProgram(blockid, typedesc, data)
+        if isinstance(self._last_block, TapeHeader) and self._last_block.is_program:
+            return DataBlockProgram(blockid, typedesc, data, pause)
 
-        return DataBlockBinary(blockid, typedesc, data)
+        return DataBlockBinary(blockid, typedesc, data, pause)
 
     def _process_turbo_speed_data(self, blockid, typedesc):
         pilot, sync1, sync2, zero, one, pilot_tone, used_bits, pause = struct.unpack_from('=HHHHHHBH', self.data, self.pos)
+        timing = (pilot, sync1, sync2, zero, one, pilot_tone, used_bits)
         self.pos += 15
-        length_bytes = b''.join(struct.unpack_from('=3s', self.data, self.pos))
+        length_bytes = bytes(self.data[self.pos:self.pos + 3])
         self.pos += 3
         length = int.from_bytes(length_bytes, byteorder='little')
-        data = b''.join(struct.unpack_from('={}c'.format(length), self.data, self.pos))
+        data = bytes(self.data[self.pos:self.pos + length])
         is_header = bool(length == 19 and data[0] == 0x00)
         self.pos += length
         if is_header:
-            return TapeHeader(blockid, typedesc, data)
+            return TapeHeader(blockid, typedesc, data, pause, timing)
 
-        # If not header, query last block appended. If this is a header, then check what type
+        # If not header, query last block parsed. If this is a header, then check what type
         # of block this is.
-        if self.blocks and isinstance(self.blocks[-1], TapeHeader) and self.blocks[-1].is_program:
-            return DataBlockProgram(blockid, typedesc, data)
+        if isinstance(self._last_block, TapeHeader) and self._last_block.is_program:
+            return DataBlockProgram(blockid, typedesc, data, pause, timing)
 
-        return DataBlockBinary(blockid, typedesc, data)
+        return DataBlockBinary(blockid, typedesc, data, pause, timing)
 
     def _process_pause_command(self, blockid, typedesc):
         pause = struct.unpack_from('=H', self.data, self.pos)[0]
-        text = "Pause: {} ms".format(pause)
         self.pos += 2
-        return DataBlockAscii(blockid, typedesc, text)
+        return DataBlockPause(blockid, typedesc, pause)
 
     def _process_text_description(self, blockid, typedesc):
         length = struct.unpack_from('=B', self.data, self.pos)[0]
@@ -204,6 +304,17 @@ class TZXHandler(Handler):
         self.pos += length
         return DataBlockAscii(blockid, typedesc, message)
 
+    def _process_raw_block(self, blockid, typedesc, fixed, count_offset, count_size, multiplier):
+        count = int.from_bytes(bytes(self.data[self.pos + count_offset:self.pos + count_offset + count_size]),
+                               byteorder='little')
+        length = fixed + multiplier * count
+        if self.pos + length > len(self.data):
+            raise RuntimeError("Block ID 0x{:02X} at offset {} runs past the end of the file".format(
+                blockid, self.block_offset))
+        data = bytes(self.data[self.pos:self.pos + length])
+        self.pos += length
+        return DataBlockRaw(blockid, typedesc, data)
+
     def _process_archive_info(self, blockid, typedesc):
         length, num_strings = struct.unpack_from('=HB', self.data, self.pos)
         self.pos += 3
@@ -235,45 +346,288 @@ class TAPHandler(Handler):
             return True
         return False
 
-    def process(self):
+    def iter_blocks(self):
         """
-        Processes the TZX File.
+        Parses the TAP File, yielding each block as it is read.
         """
+        self.pos = 0
+        self._last_block = None
         while self.pos < len(self.data):
+            self.block_offset = self.pos
             length = struct.unpack_from('<H', self.data, self.pos)[0]
             self.pos += 2
 
             block = self._process_block(length)
 
-            self.blocks.append(block)
-
-    def summarize(self):
-        """
-        Summarize the contents of each block to stdout.
-        """
-        for i, block in enumerate(self.blocks):
-            print("Block: {:4d} ({}) - {}".format(i, block.idstr, block.typedesc))
-
-    def dump(self, block_idx=None):
-        """
-        Output to stdout, the content of each block.
-        """
-        for i, block in enumerate(self.blocks):
-            if i == block_idx or block_idx is None:
-                print("Block: {:4d} ({})".format(i, block.idstr))
-                print(block.dump)
+            self._last_block = block
+            yield block
 
     def _process_block(self, length):
         typedesc = "Data Block"
-        data = b''.join(struct.unpack_from('={}c'.format(length), self.data, self.pos))
+        data = bytes(self.data[self.pos:self.pos + length])
         is_header = bool(length == 19 and data[0] == 0x00)
         self.pos += length
         if is_header:
             return TapeHeader(None, typedesc, data)
 
-        # If not header, query last block appended. If this is a header, then check what type
+        # If not header, query last block parsed. If this is a header, then check what type
         # of block this is.
-        if self.blocks and isinstance(self.blocks[-1], TapeHeader) and self.blocks[-1].is_program:
+        if isinstance(self._last_block, TapeHeader) and self._last_block.is_program:
             return DataBlockProgram(None, typedesc, data)
 
         return DataBlockBinary(None, typedesc, data)
+
+class WAVHandler(Handler):
+    """
+    Class for decoding blocks from a WAV recording of a tape.
+    """
+    def __init__(self, data):
+        super(WAVHandler, self).__init__(data)
+
+    @staticmethod
+    def can_handle(filename, data):
+        """
+        Returns True if this handler can deal with this file.
+        """
+        return bytes(data[0:4]) == b"RIFF" and bytes(data[8:12]) == b"WAVE"
+
+    def iter_blocks(self):
+        """
+        Decodes the recording, yielding each block as it is found.
+        """
+        from zxutils.audio import TapeDecoder # pylint: disable=import-outside-toplevel
+
+        stream = io.BytesIO(self.data) if isinstance(self.data, bytes) else self.data
+        stream.seek(0)
+        self._last_block = None
+        for data in TapeDecoder(stream).blocks():
+            block = self._process_block(data)
+            self._last_block = block
+            yield block
+
+    def _process_block(self, data):
+        checksum_ok = calc_checksum(data[:-1]) == data[-1]
+        typedesc = "Audio Data Block" if checksum_ok else "Audio Data Block (checksum error)"
+        # A noisy recording can corrupt the block type, which is only read as a header if it is a known type
+        if len(data) == 19 and data[0] == 0x00 and data[1] <= 3:
+            return TapeHeader(None, typedesc, data)
+
+        # If not header, query last block parsed. If this is a header, then check what type
+        # of block this is.
+        if isinstance(self._last_block, TapeHeader) and self._last_block.is_program:
+            return DataBlockProgram(None, typedesc, data)
+
+        return DataBlockBinary(None, typedesc, data)
+
+class SnapshotHandler(Handler):
+    """
+    Base class for handling memory snapshots. The first block holds the registers and the rest hold the memory.
+    """
+    def __init__(self, data):
+        super(SnapshotHandler, self).__init__(data)
+        self.registers = None
+        self.memory = None
+        self.banks = dict()
+        self._screen_idx = 1
+
+    def iter_blocks(self):
+        """
+        Loads the snapshot, yielding the registers block and then a block per page of memory.
+        """
+        if self.registers is None:
+            self._load()
+        self._last_block = SnapshotRegisters(None, "Registers", self.registers)
+        yield self._last_block
+
+        if self.banks:
+            # 128K snapshot - one block per RAM bank, noting where the paged banks are mapped
+            paged = {5: 0x4000, 2: 0x8000}
+            paged.setdefault(self.registers["port_7ffd"] & 0x07, 0xc000)
+            for bank in sorted(self.banks):
+                self._last_block = DataBlockMemory(None, "Memory", self.banks[bank], paged.get(bank), bank)
+                yield self._last_block
+        else:
+            for address in range(0x4000, 0x10000, 0x4000):
+                page = self.memory[address - 0x4000:address]
+                self._last_block = DataBlockMemory(None, "Memory", page, address)
+                yield self._last_block
+
+    @property
+    def screen(self):
+        """
+        Returns a memoryview of the 6912 bytes of the screen being displayed.
+        """
+        if self.registers is None:
+            self._load()
+        if self.banks and self.registers["port_7ffd"] & 0x08:
+            # The shadow screen in bank 7 is being displayed
+            return memoryview(self.banks[7])[0:6912]
+        return memoryview(self.memory)[0:6912]
+
+    def decode_to_png(self, file_prefix, block_idx=None):
+        """
+        Write out the screen being displayed.
+        """
+        if block_idx is None or block_idx == self._screen_idx:
+            filename = "{}_{:03d}.png".format(file_prefix, self._screen_idx)
+            write_zxscr_to_png(filename, self.screen)
+
+    def _load(self):
+        """
+        Parse the snapshot, filling in the registers, the 48K of memory from 0x4000 and (for 128K) the RAM banks.
+        """
+        pass
+
+    def _page_in_128k(self, port):
+        """
+        Build the 48K memory view for a 128K snapshot from the banks paged in by port 0x7ffd.
+        """
+        self.memory = bytearray(self.banks[5]) + bytearray(self.banks[2]) + bytearray(self.banks[port & 0x07])
+        self._screen_idx = sorted(self.banks).index(7 if port & 0x08 else 5) + 1
+
+class SNAHandler(SnapshotHandler):
+    """
+    Class for handling 48K and 128K .SNA snapshots.
+    """
+    SIZE_48K = 49179
+    SIZES_128K = (131103, 147487)
+
+    def __init__(self, data):
+        super(SNAHandler, self).__init__(data)
+
+    @staticmethod
+    def can_handle(filename, data):
+        """
+        Returns True if this handler can deal with this file.
+        """
+        _, ext = os.path.splitext(filename)
+        return ext.lower() == ".sna" and len(data) in (SNAHandler.SIZE_48K,) + SNAHandler.SIZES_128K
+
+    def _load(self):
+        i, hl2, de2, bc2, af2, hl, de, bc, iy, ix, iff2, r, af, sp, im, border = \
+            struct.unpack_from('<BHHHHHHHHHBBHHBB', self.data, 0)
+        registers = {"PC": 0, "SP": sp, "AF": af, "BC": bc, "DE": de, "HL": hl, "IX": ix, "IY": iy, "AF'": af2,
+                     "BC'": bc2, "DE'": de2, "HL'": hl2, "I": i, "R": r, "IFF1": (iff2 >> 2) & 1,
+                     "IFF2": (iff2 >> 2) & 1, "IM": im, "border": border}
+        self.pos = 27
+        if len(self.data) == SNAHandler.SIZE_48K:
+            self.memory = bytearray(self.data[self.pos:self.pos + 49152])
+            # The PC was pushed onto the stack when the snapshot was taken
+            if 0x4000 <= sp < 0xffff:
+                registers["PC"] = struct.unpack_from('<H', self.memory, sp - 0x4000)[0]
+                registers["SP"] = (sp + 2) & 0xffff
+        else:
+            # Banks 5, 2 and the paged bank come first, then the PC, port 0x7ffd and the remaining banks
+            port = self.data[self.pos + 49152 + 2]
+            paged = port & 0x07
+            for n, bank in enumerate((5, 2, paged)):
+                self.banks[bank] = bytes(self.data[self.pos + n * 16384:self.pos + (n + 1) * 16384])
+            registers["PC"] = struct.unpack_from('<H', self.data, self.pos + 49152)[0]
+            registers["port_7ffd"] = port
+            pos = self.pos + 49152 + 4
+            for bank in range(8):
+                if bank not in (5, 2, paged):
+                    self.banks[bank] = bytes(self.data[pos:pos + 16384])
+                    pos += 16384
+            self._page_in_128k(port)
+        self.registers = registers
+
+class Z80Handler(SnapshotHandler):
+    """
+    Class for handling version 1, 2 and 3 .Z80 snapshots (48K and 128K).
+    """
+    def __init__(self, data):
+        super(Z80Handler, self).__init__(data)
+        self.version = None
+
+    @staticmethod
+    def can_handle(filename, data):
+        """
+        Returns True if this handler can deal with this file.
+        """
+        _, ext = os.path.splitext(filename)
+        return ext.lower() == ".z80" and len(data) >= 30
+
+    def _load(self):
+        a, f, bc, hl, pc, sp, i, r, flags, de, bc2, de2, hl2, a2, f2, iy, ix, iff1, iff2, flags2 = \
+            struct.unpack_from('<BBHHHHBBBHHHHBBHHBBB', self.data, 0)
+        if flags == 0xff:
+            flags = 1
+        registers = {"PC": pc, "SP": sp, "AF": a << 8 | f, "BC": bc, "DE": de, "HL": hl, "IX": ix, "IY": iy,
+                     "AF'": a2 << 8 | f2, "BC'": bc2, "DE'": de2, "HL'": hl2, "I": i,
+                     "R": (r & 0x7f) | ((flags & 0x01) << 7), "IFF1": 1 if iff1 else 0, "IFF2": 1 if iff2 else 0,
+                     "IM": flags2 & 0x03, "border": (flags >> 1) & 0x07}
+        self.pos = 30
+
+        if pc != 0:
+            # Version 1 - a single 48K memory image that may be compressed
+            self.version = 1
+            self.memory = bytearray(49152)
+            if flags & 0x20:
+                z80_decompress(self.data, self.memory, self.pos)
+            else:
+                self.memory[:] = self.data[self.pos:self.pos + 49152]
+            self.registers = registers
+            return
+
+        extra_length, pc, hardware, port = struct.unpack_from('<HHBB', self.data, self.pos)
+        registers["PC"] = pc
+        self.version = 2 if extra_length == 23 else 3
+        is_128k = hardware >= 3 if self.version == 2 else hardware >= 4
+        self.pos += 2 + extra_length
+
+        # 48K snapshots use pages 8, 4 and 5 for 0x4000, 0x8000 and 0xC000. 128K snapshots store bank n as page n+3.
+        pages_48k = {8: 0, 4: 1, 5: 2}
+        self.memory = bytearray(49152)
+        while self.pos + 3 <= len(self.data):
+            length, page = struct.unpack_from('<HB', self.data, self.pos)
+            self.pos += 3
+            buf = bytearray(16384)
+            if length == 0xffff:
+                buf[:] = self.data[self.pos:self.pos + 16384]
+                self.pos += 16384
+            else:
+                z80_decompress(self.data[self.pos:self.pos + length], buf)
+                self.pos += length
+            if is_128k:
+                self.banks[page - 3] = bytes(buf)
+            elif page in pages_48k:
+                start = pages_48k[page] * 16384
+                self.memory[start:start + 16384] = buf
+
+        if is_128k:
+            registers["port_7ffd"] = port
+            self._page_in_128k(port)
+        self.registers = registers
+
+def handler_for(filename, data):
+    """
+    Returns a handler for the file data, choosing the handler class from the filename and content.
+    """
+    for handler in (TZXHandler, TAPHandler, WAVHandler, SNAHandler, Z80Handler):
+        if handler.can_handle(filename, data):
+            return handler(data)
+    raise RuntimeError("The {} file appears to be an unsupported type.".format(filename))
+
+def unzip(file):
+    """
+    Returns the (filename, data) of the first file in a ZIP archive (a path or a file object).
+    """
+    import zipfile # pylint: disable=import-outside-toplevel
+
+    with zipfile.ZipFile(file) as zipf:
+        # For now get first file in zip - this will need improving at some point
+        filename = zipf.namelist()[0]
+        return filename, zipf.read(filename)
+
+def load_file(path):
+    """
+    Returns the (filename, data) of a file to process, unpacking it if it is a ZIP archive.
+    """
+    if os.path.getsize(path) == 0:
+        return path, b''
+    with open(path, "rb") as f:
+        if f.read(4) == b"PK\x03\x04":
+            return unzip(f)
+        # Map the file rather than reading it so that large files are only paged in as they are parsed
+        return path, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
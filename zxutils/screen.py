@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Heuristics for finding ZX Spectrum screens inside arbitrary binary data.
+
+Screens saved by turbo or headerless loaders carry no CODE header pointing at 16384, so the only way to find
+them is to look at the data itself. Every statistic here is computed with whole-region byte operations (big
+integer XORs, bytes.count and bytes.translate) so that scanning a large corpus stays cheap.
+"""
+
+SCREEN_BITMAP_SIZE = 6144
+SCREEN_ATTR_SIZE = 768
+SCREEN_SIZE = SCREEN_BITMAP_SIZE + SCREEN_ATTR_SIZE
+
+# Attribute used when a candidate region only covers the bitmap (black ink on white paper).
+DEFAULT_ATTR = 0x38
+
+# Translation table that maps every attribute with the FLASH bit set to 0x01 and everything else to 0x00.
+_FLASH_TABLE = bytes(1 if i & 0x80 else 0 for i in range(256))
+
+def _equal_ratio(data, distance):
+    """
+    Returns the fraction of bytes in data that are equal to the byte `distance` positions later.
+    """
+    length = len(data) - distance
+    if length <= 0:
+        return 0.0
+    diff = int.from_bytes(data[:length], 'little') ^ int.from_bytes(data[distance:], 'little')
+    return diff.to_bytes(length, 'little').count(0) / length
+
+def _ink_pairs(first, second):
+    """
+    Compares two equal length byte strings position by position, ignoring pairs where both bytes are 0x00 or both
+    are 0xFF. Returns (equal, total) counts for the remaining pairs.
+    """
+    length = len(first)
+    a = int.from_bytes(first, 'little')
+    b = int.from_bytes(second, 'little')
+    equal = (a ^ b).to_bytes(length, 'little').count(0)
+    blank = (a | b).to_bytes(length, 'little').count(0) + (a & b).to_bytes(length, 'little').count(0xff)
+    return equal - blank, length - blank
+
+# Fewest non-blank pairs needed before a bitmap is given any credit.
+_MIN_INK_PAIRS = 64
+
+def _bitmap_coherence(bitmap):
+    """
+    Measures how much a 6144 byte region looks like the bitmap part of a screen, as the excess of row coherence
+    over a baseline (unbounded, 0.4 or more is a clear match).
+
+    Within a character cell, consecutive pixel rows are 256 bytes apart in screen memory and are usually very
+    similar in real artwork, whereas code and compressed data show almost no correlation at that distance. Only
+    pairs of rows within the same cell are compared. Blank pairs (both 0x00 or both 0xFF) match trivially in
+    padding and buffers as well as in artwork, so they are left out, and the coherence is measured against a
+    baseline at a distance that is not a pixel row.
+    """
+    equal, total = 0, 0
+    for third in range(0, SCREEN_BITMAP_SIZE, 2048):
+        pair_equal, pair_total = _ink_pairs(bitmap[third:third + 1792], bitmap[third + 256:third + 2048])
+        equal += pair_equal
+        total += pair_total
+    if total < _MIN_INK_PAIRS:
+        # An empty (or completely filled) bitmap is a valid screen but there is nothing to distinguish it from
+        # padding, so it gets no credit at all.
+        return 0.0
+    base_equal, base_total = _ink_pairs(bitmap[:-97], bitmap[97:])
+    baseline = base_equal / base_total if base_total else 0.0
+    return max(0.0, equal / total - baseline)
+
+def _attr_score(attrs):
+    """
+    Scores a 768 byte region on how much it looks like the attribute part of a screen.
+    """
+    horizontal = _equal_ratio(attrs, 1)
+    vertical = _equal_ratio(attrs, 32)
+    flash = sum(attrs.translate(_FLASH_TABLE)) / len(attrs)
+    distinct = len(set(attrs))
+    return 0.4 * max(horizontal, vertical) + 0.3 * (1.0 - flash) + 0.3 * max(0.0, 1.0 - (distinct - 1) / 64)
+
+def _bitmap_score(bitmap):
+    """
+    Scores a 6144 byte region on how much it looks like the bitmap part of a screen.
+    """
+    return min(1.0, _bitmap_coherence(bitmap) / 0.4)
+
+def score_screen(data, offset=0):
+    """
+    Returns a confidence score between 0.0 and 1.0 that data at offset holds a screen.
+
+    If the attribute area is not available (the region is shorter than 6912 bytes) the score is based on the
+    bitmap alone and scaled down to reflect the missing evidence.
+    """
+    bitmap = bytes(data[offset:offset + SCREEN_BITMAP_SIZE])
+    if len(bitmap) < SCREEN_BITMAP_SIZE:
+        return 0.0
+    bitmap_score = _bitmap_score(bitmap)
+    attrs = bytes(data[offset + SCREEN_BITMAP_SIZE:offset + SCREEN_SIZE])
+    if len(attrs) < SCREEN_ATTR_SIZE:
+        return 0.8 * bitmap_score
+    return 0.6 * bitmap_score + 0.4 * _attr_score(attrs)
+
+def _alignment(data, offset):
+    """
+    Measures how well a 6912 byte region lines up with a screen, for choosing between nearby candidates. Returns
+    (matches, -strays) where matches counts the equal pairs, leaving out blank ones, of bitmap bytes a pixel row
+    apart (anywhere in the bitmap) and of attributes side by side or a row apart, and strays counts the unequal
+    bitmap pairs and the attributes with the FLASH bit set. A region without a complete attribute area is
+    measured on its bitmap alone.
+
+    Scores can't pin a screen down to the byte. The bitmap coherence compares rows within each third, and in text
+    drawn with a ROM style font the blank top and bottom rows of each cell make a window about a pixel row out
+    look more coherent than the true one. Counting pairs over the whole region instead, moving the window off a
+    screen only changes the pairs at its edges: it gives up matches inside the screen for pairs with unrelated
+    bytes that rarely match, so the count peaks where the region lines up. Where the edges of a screen are blank
+    the matches can tie, and strays tell apart a window that takes in code or other data.
+    """
+    region = bytes(data[offset:offset + SCREEN_SIZE])
+    bitmap_equal, bitmap_total = _ink_pairs(region[:SCREEN_BITMAP_SIZE - 256], region[256:SCREEN_BITMAP_SIZE])
+    attrs = region[SCREEN_BITMAP_SIZE:]
+    if len(attrs) < SCREEN_ATTR_SIZE:
+        return bitmap_equal, bitmap_equal - bitmap_total
+    horizontal = _ink_pairs(attrs[:-1], attrs[1:])[0]
+    vertical = _ink_pairs(attrs[:-32], attrs[32:])[0]
+    strays = bitmap_total - bitmap_equal + sum(attrs.translate(_FLASH_TABLE))
+    return bitmap_equal + horizontal + vertical, -strays
+
+def _refine(data, offset, alignments):
+    """
+    Returns the best aligned offset within 255 bytes either side of a coarse match. Regions with a complete
+    attribute area are preferred, as they line up far more precisely. alignments caches the alignment of each
+    offset tried.
+    """
+    last = len(data) - SCREEN_SIZE
+    if last < max(0, offset - 255):
+        last = len(data) - SCREEN_BITMAP_SIZE
+    candidates = range(max(0, offset - 255), min(offset + 256, last + 1))
+    for candidate in candidates:
+        if candidate not in alignments:
+            alignments[candidate] = _alignment(data, candidate)
+    return max(candidates, key=alignments.get)
+
+def find_screens(data, step=256, threshold=0.5):
+    """
+    Scan data for likely screens.
+
+    Candidate regions are first scored at every multiple of step, then the offset of each match is refined byte
+    by byte. Returns a list of (offset, size, score) tuples, where size is 6912 if the attributes are included
+    and 6144 otherwise, sorted with the most likely screen first. Overlapping candidates are reduced to the best
+    aligned one.
+    """
+    matches = [offset for offset in range(0, len(data) - SCREEN_BITMAP_SIZE + 1, step)
+               if score_screen(data, offset) >= threshold]
+
+    # The best scoring match may be a neighbour of the true offset, more than 255 bytes away, so every match is
+    # refined and overlapping ones are then compared on how well they line up
+    alignments = dict()
+    refined = set(_refine(data, offset, alignments) for offset in matches)
+    screens = list()
+    for offset in sorted(refined, key=lambda offset: (alignments[offset], -offset), reverse=True):
+        size = SCREEN_SIZE if offset + SCREEN_SIZE <= len(data) else SCREEN_BITMAP_SIZE
+        score = score_screen(data, offset)
+        if score >= threshold and all(offset + size <= other or other + other_size <= offset
+                                      for other, other_size, _ in screens):
+            screens.append((offset, size, score))
+    return sorted(screens, key=lambda screen: screen[2], reverse=True)
+
+def screen_data(data, offset, size):
+    """
+    Returns the 6912 bytes of a screen found at offset, padding a bitmap-only region with default attributes.
+    """
+    scr = bytes(data[offset:offset + size])
+    if size < SCREEN_SIZE:
+        scr += bytes([DEFAULT_ATTR]) * (SCREEN_SIZE - size)
+    return scr
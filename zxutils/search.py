@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Full-text search over a corpus of tapes.
+
+Each tape is parsed once and the searchable text it holds (Basic program lines, tape header filenames and the
+text and archive info blocks) is stored in an inverted index in an SQLite database along with each file's size and
+modification time. Updating the index only reparses files that have changed, and queries are answered from the
+index alone.
+"""
+
+import collections
+import os
+import re
+import sqlite3
+
+from zxutils.blocks import DataBlockAscii, DataBlockArchive, DataBlockPause, DataBlockProgram, TapeHeader
+from zxutils.handlers import handler_for, load_file
+
+# A single search result. line is the Basic line number for program lines and None for other kinds of text.
+Hit = collections.namedtuple('Hit', ['path', 'block', 'line', 'kind', 'text'])
+
+# File extensions picked up when indexing a directory.
+INDEX_EXTENSIONS = ('.tap', '.tzx', '.wav', '.zip')
+
+# Terms are words (with any trailing $ of string variables and functions) and numbers.
+_TERM_RE = re.compile(r'[a-z]+\$?|\d+(?:\.\d+)?')
+_QUERY_RE = re.compile(r'"([^"]*)"?|(\S+)')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, mtime REAL, size INTEGER);
+CREATE TABLE IF NOT EXISTS documents (id INTEGER PRIMARY KEY, file_id INTEGER NOT NULL, block INTEGER,
+                                      line INTEGER, kind TEXT, text TEXT);
+CREATE INDEX IF NOT EXISTS documents_file ON documents (file_id);
+CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc_id INTEGER NOT NULL, PRIMARY KEY (term, doc_id))
+    WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+"""
+
+def terms(text):
+    """
+    Returns the set of index terms in a piece of text.
+    """
+    return set(_TERM_RE.findall(text.lower()))
+
+def documents(processor):
+    """
+    Generator that yields a (block index, line number, kind, text) tuple for each piece of searchable text in a file.
+    """
+    for i, block in enumerate(processor.iter_blocks()):
+        if isinstance(block, DataBlockProgram):
+            for line in block.program:
+                yield i, line.number, 'program', line.text
+        elif isinstance(block, TapeHeader):
+            yield i, None, 'header', block.filename.rstrip()
+        elif isinstance(block, DataBlockArchive):
+            for _, text in block.descriptions:
+                yield i, None, 'archive', text
+        elif isinstance(block, DataBlockAscii) and not isinstance(block, DataBlockPause):
+            yield i, None, 'text', block.text
+
+def _walk(paths):
+    """
+    Generator that yields the absolute path of each file to index, searching any directories for tape files.
+    """
+    for path in paths:
+        if not os.path.isdir(path):
+            yield os.path.abspath(path)
+            continue
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(INDEX_EXTENSIONS):
+                    yield os.path.abspath(os.path.join(root, name))
+
+class SearchIndex:
+    """
+    Class for building and querying the search index held in an SQLite database file.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self._db = sqlite3.connect(filename)
+        self._db.execute("PRAGMA synchronous = NORMAL")
+        self._db.executescript(_SCHEMA)
+
+    def close(self):
+        """
+        Close the database.
+        """
+        self._db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def update(self, paths):
+        """
+        Bring the index up to date with the given files and directories. Files that are unchanged since they were
+        last indexed are skipped and files that no longer exist are dropped. Returns a dictionary of counts along
+        with the (path, error) list of files that could not be parsed.
+        """
+        stats = {"indexed": 0, "unchanged": 0, "removed": 0, "errors": list()}
+        with self._db:
+            known = {path: (file_id, mtime, size)
+                     for file_id, path, mtime, size in self._db.execute("SELECT id, path, mtime, size FROM files")}
+            for path in _walk(paths):
+                try:
+                    stat = os.stat(path)
+                    if path in known:
+                        file_id, mtime, size = known[path]
+                        if mtime == stat.st_mtime and size == stat.st_size:
+                            stats["unchanged"] += 1
+                            continue
+                        self._remove(file_id)
+                    self._add(path, stat)
+                    stats["indexed"] += 1
+                except Exception as error: # pylint: disable=broad-except
+                    stats["errors"].append((path, str(error)))
+
+            for path, (file_id, _, _) in known.items():
+                if not os.path.exists(path):
+                    self._remove(file_id)
+                    stats["removed"] += 1
+        return stats
+
+    def _add(self, path, stat):
+        """
+        Parse a file and add its text to the index. Nothing is written unless the whole file parses.
+        """
+        filename, data = load_file(path)
+        docs = list(documents(handler_for(filename, data)))
+
+        cursor = self._db.execute("INSERT INTO files (path, mtime, size) VALUES (?, ?, ?)",
+                                  (path, stat.st_mtime, stat.st_size))
+        file_id = cursor.lastrowid
+        postings = list()
+        for block, line, kind, text in docs:
+            doc_id = self._db.execute("INSERT INTO documents (file_id, block, line, kind, text) "
+                                      "VALUES (?, ?, ?, ?, ?)", (file_id, block, line, kind, text)).lastrowid
+            postings.extend((term, doc_id) for term in terms(text))
+        self._db.executemany("INSERT INTO postings (term, doc_id) VALUES (?, ?)", postings)
+
+    def _remove(self, file_id):
+        self._db.execute("DELETE FROM postings WHERE doc_id IN (SELECT id FROM documents WHERE file_id = ?)",
+                         (file_id,))
+        self._db.execute("DELETE FROM documents WHERE file_id = ?", (file_id,))
+        self._db.execute("DELETE FROM files WHERE id = ?", (file_id,))
+
+    def query(self, text, kind=None, limit=100):
+        """
+        Returns the list of hits matching a query. Every word must appear (in any case) and "quoted phrases" must
+        appear as written (ignoring case), e.g. `POKE 23606` or `"RANDOMIZE USR 32768"`. Results can be limited
+        to one kind of text (program, header, archive or text).
+        """
+        phrases = list()
+        words = set()
+        for phrase, word in _QUERY_RE.findall(text):
+            if phrase:
+                phrases.append(phrase.lower())
+            words.update(terms(phrase or word))
+        if not words:
+            return list()
+
+        # Intersect the posting lists of every term, then check any phrases against the matching text
+        sql = " INTERSECT ".join(["SELECT doc_id FROM postings WHERE term = ?"] * len(words))
+        sql = "SELECT files.path, documents.block, documents.line, documents.kind, documents.text " \
+            "FROM documents JOIN files ON files.id = documents.file_id WHERE documents.id IN ({})".format(sql)
+        params = list(words)
+        if kind is not None:
+            sql += " AND documents.kind = ?"
+            params.append(kind)
+        sql += " ORDER BY files.path, documents.block, documents.line"
+        if not phrases:
+            sql += " LIMIT ?"
+            params.append(limit)
+
+        hits = list()
+        for row in self._db.execute(sql, params):
+            hit = Hit(*row)
+            if all(phrase in hit.text.lower() for phrase in phrases):
+                hits.append(hit)
+                if len(hits) == limit:
+                    break
+        return hits
+
+    @property
+    def stats(self):
+        """
+        Returns the number of files, documents and distinct terms in the index.
+        """
+        return {name: self._db.execute(sql).fetchone()[0] for name, sql in (
+            ("files", "SELECT COUNT(*) FROM files"), ("documents", "SELECT COUNT(*) FROM documents"),
+            ("terms", "SELECT COUNT(DISTINCT term) FROM postings"))}
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Resident worker that processes tapes over a local HTTP endpoint.
+
+Running the utilities as a long lived service means interpreter startup, codec registration and the Pillow import
+are paid once rather than per file. Requests are accepted by an asyncio server and the CPU heavy parsing and
+rendering is handed to a pool of worker processes (which are warmed up when they start).
+
+Endpoints:
+    POST /process?filename=NAME[&extract=png,txt,bin]   Body holds the file data (TZX/TAP/WAV/ZIP).
+    POST /process?path=PATH[&extract=png,txt,bin]       Process a file that is already on disk.
+    GET /metrics                                        Request counts and latency statistics.
+"""
+
+import argparse
+import asyncio
+import base64
+import collections
+import concurrent.futures
+import glob
+import io
+import json
+import os
+import tempfile
+import time
+import urllib.parse
+import zipfile
+
+from zxutils.handlers import handler_for, load_file, unzip
+
+# Largest request body accepted (in bytes).
+MAX_BODY_SIZE = 64 * 1024 * 1024
+
+# Number of recent request latencies kept for the metrics percentiles.
+LATENCY_HISTORY = 1000
+
+def _warm_up():
+    """
+    Worker process initializer that imports everything a request may need up front.
+    """
+    import codecs # pylint: disable=import-outside-toplevel
+    from zxutils.utils import _import_pil # pylint: disable=import-outside-toplevel
+
+    codecs.lookup('zxbasic')
+    try:
+        _import_pil()
+    except RuntimeError:
+        # Without Pillow only png extraction fails, which is reported per request
+        pass
+
+def process_tape(filename, data=None, path=None, extract=()):
+    """
+    Process a tape and return a JSON serialisable summary of its blocks, along with any extracted artifacts
+    (base64 encoded). Either data or path must be given. This runs in a worker process.
+    """
+    if path is not None:
+        filename, data = load_file(path)
+    elif zipfile.is_zipfile(io.BytesIO(data)):
+        filename, data = unzip(io.BytesIO(data))
+
+    processor = handler_for(filename, data)
+    processor.process()
+    summary = {
+        "filename": filename,
+        "blocks": [{"index": i, "id": block.blockid, "type": block.typedesc}
+                   for i, block in enumerate(processor.blocks)],
+        "artifacts": dict(),
+    }
+
+    if extract:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            prefix = os.path.join(tmpdir, "block")
+            for extract_type in extract:
+                if extract_type == 'png':
+                    processor.decode_to_png(prefix)
+                elif extract_type == 'txt':
+                    processor.decode_to_txt(prefix)
+                elif extract_type == 'bin':
+                    processor.decode_to_bin(prefix)
+                else:
+                    raise ValueError("Unsupported extract type: {}".format(extract_type))
+            for artifact in sorted(glob.glob(prefix + "_*")):
+                with open(artifact, "rb") as f:
+                    summary["artifacts"][os.path.basename(artifact)] = base64.b64encode(f.read()).decode('ascii')
+    return summary
+
+class Metrics:
+    """
+    Class for keeping request counts and latencies.
+    """
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.latencies = collections.deque(maxlen=LATENCY_HISTORY)
+
+    def record(self, latency, ok):
+        """
+        Record a finished request.
+        """
+        self.requests += 1
+        self.errors += 0 if ok else 1
+        self.latencies.append(latency)
+
+    def summary(self):
+        """
+        Returns the metrics as a JSON serialisable dictionary (latencies in milliseconds).
+        """
+        latencies = sorted(self.latencies)
+        def percentile(fraction):
+            return round(latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000, 3)
+        stats = {"requests": self.requests, "errors": self.errors, "in_flight": self.in_flight}
+        if latencies:
+            stats.update({"latency_ms": {"mean": round(sum(latencies) / len(latencies) * 1000, 3),
+                                         "p50": percentile(0.5), "p95": percentile(0.95), "max": percentile(1.0)}})
+        return stats
+
+class Server:
+    """
+    Class for serving tape processing requests from a pool of worker processes.
+    """
+    def __init__(self, workers=None, max_concurrent=8):
+        self.pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=_warm_up)
+        self.limit = asyncio.Semaphore(max_concurrent)
+        self.metrics = Metrics()
+
+    async def handle_connection(self, reader, writer):
+        """
+        Serve the HTTP requests on one connection (keep-alive is supported).
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(" ", 2)
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                if length > MAX_BODY_SIZE:
+                    await self._respond(writer, 413, {"error": "Request body is too large"}, close=True)
+                    break
+                body = await reader.readexactly(length) if length else b''
+                status, result = await self.handle_request(method, target, body)
+                close = headers.get("connection", "").lower() == "close"
+                await self._respond(writer, status, result, close)
+                if close:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def handle_request(self, method, target, body):
+        """
+        Dispatch a request, returning the HTTP status and a JSON serialisable result.
+        """
+        url = urllib.parse.urlsplit(target)
+        query = dict(urllib.parse.parse_qsl(url.query))
+        if method == "GET" and url.path == "/metrics":
+            return 200, self.metrics.summary()
+        if method != "POST" or url.path != "/process":
+            return 404, {"error": "Unknown request {} {}".format(method, url.path)}
+
+        extract = [x.strip() for x in query["extract"].split(",")] if query.get("extract") else []
+        start = time.perf_counter()
+        self.metrics.in_flight += 1
+        try:
+            async with self.limit:
+                loop = asyncio.get_running_loop()
+                if "path" in query:
+                    job = loop.run_in_executor(self.pool, process_tape, query["path"], None, query["path"], extract)
+                else:
+                    job = loop.run_in_executor(self.pool, process_tape, query.get("filename", "upload.tap"), body,
+                                               None, extract)
+                result = await job
+            status = 200
+        except Exception as error: # pylint: disable=broad-except
+            result, status = {"error": str(error)}, 400
+        finally:
+            self.metrics.in_flight -= 1
+        latency = time.perf_counter() - start
+        self.metrics.record(latency, status == 200)
+        result["latency_ms"] = round(latency * 1000, 3)
+        return status, result
+
+    @staticmethod
+    async def _respond(writer, status, result, close=False):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large"}
+        body = json.dumps(result).encode('utf-8')
+        writer.write("HTTP/1.1 {} {}\r\nContent-Type: application/json\r\nContent-Length: {}\r\n"
+                     "Connection: {}\r\n\r\n".format(status, reasons[status], len(body),
+                                                     "close" if close else "keep-alive").encode('latin-1'))
+        writer.write(body)
+        await writer.drain()
+
+async def serve(host="127.0.0.1", port=8080, socket_path=None, workers=None, max_concurrent=8):
+    """
+    Run the server until it is cancelled. A Unix domain socket is used instead of TCP if socket_path is given.
+    """
+    server = Server(workers, max_concurrent)
+    if socket_path:
+        listener = await asyncio.start_unix_server(server.handle_connection, path=socket_path)
+    else:
+        listener = await asyncio.start_server(server.handle_connection, host, port)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        server.pool.shutdown()
+
+def _main():
+    """
+    Application entrypoint when executing the module directly.
+    """
+    parser = argparse.ArgumentParser(description='Resident worker for processing ZX Spectrum files.')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='Address to listen on.')
+    parser.add_argument('--port', type=int, default=8080, help='Port to listen on.')
+    parser.add_argument('--socket', metavar='PATH', type=str, help='Listen on a Unix domain socket instead of TCP.')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (defaults to the CPU count).')
+    parser.add_argument('--max-concurrent', type=int, default=8, help='Maximum number of requests processed at once.')
+
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(serve(args.host, args.port, args.socket, args.workers, args.max_concurrent))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    _main()
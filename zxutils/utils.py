@@ -4,10 +4,15 @@
 Contains utility functions useful for ZX Spectrum content.
 """
 
-try:
-    from PIL import Image, ImageDraw
-except ImportError:
-    print("WARNING: Image handling requires Pillow")
+def _import_pil():
+    """
+    Imports Pillow on first use so that only image rendering pays for it.
+    """
+    try:
+        from PIL import Image, ImageDraw # pylint: disable=import-outside-toplevel
+    except ImportError:
+        raise RuntimeError("Image handling requires Pillow")
+    return Image, ImageDraw
 
 def to_zxvert(y):
     """
@@ -34,6 +39,7 @@ def write_zxscr_to_png(filename, data):
     """
     Converts ZX screen data to a PNG file.
     """
+    Image, ImageDraw = _import_pil()
     zxdata = bytearray()
     HEIGHT = 192
     WIDTH = 256
@@ -65,4 +71,48 @@ def write_zxscr_to_png(filename, data):
 
     image_final = Image.composite(image_ink, image_paper, image_mask)
     image_final.save(filename, format="PNG")
-    
+
+def write_bitmap_to_png(filename, bitmap, scale=1):
+    """
+    Converts a packed 1-bit bitmap (see zxutils.graphics) to a PNG file, drawing black ink on white paper.
+    """
+    Image, _ = _import_pil()
+    # Pillow treats a set bit as white, so invert the bitmap
+    data = bitmap.data.translate(bytes(255 - i for i in range(256)))
+    image = Image.frombuffer("1", (bitmap.width, bitmap.height), data, "raw", "1", 0, 1)
+    if scale > 1:
+        image = image.resize((bitmap.width * scale, bitmap.height * scale), Image.NEAREST)
+    image.save(filename, format="PNG")
+
+
+def z80_decompress(data, out, pos=0):
+    """
+    Decompresses the ED ED run-length encoding used by .Z80 snapshots from data (starting at pos) into the
+    preallocated buffer out, stopping when it is full. Returns the position in data after the last byte used.
+    Raises ValueError if the data ends part way through an ED ED run.
+
+    Literal runs are copied with slice assignment between ED ED markers, so only the runs cost Python work.
+    """
+    out = memoryview(out)
+    size = len(out)
+    filled = 0
+    while filled < size:
+        marker = data.find(b'\xed\xed', pos)
+        literal_end = len(data) if marker < 0 else marker
+        count = min(literal_end - pos, size - filled)
+        out[filled:filled + count] = data[pos:pos + count]
+        filled += count
+        pos += count
+        if filled >= size or marker < 0:
+            break
+        if marker + 2 < len(data) and data[marker + 2] == 0:
+            # 00 ED ED 00 marks the end of a version 1 snapshot
+            break
+        if marker + 3 >= len(data):
+            raise ValueError("Truncated Z80 data: ED ED run at offset {} is incomplete".format(marker))
+        repeat, value = data[marker + 2], data[marker + 3]
+        repeat = min(repeat, size - filled)
+        out[filled:filled + repeat] = bytes((value,)) * repeat
+        filled += repeat
+        pos = marker + 4
+    return pos
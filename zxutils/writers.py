@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Contains the writer classes that serialise blocks back out to TAP and TZX files.
+
+Writers take an open binary file object and write each block as soon as it is passed in, so they can be fed
+straight from a handler's iter_blocks() generator without the whole tape ever being held in memory.
+"""
+
+import struct
+import sys
+
+from zxutils.blocks import Header, DataBlockAscii, DataBlockArchive, DataBlockBinary, DataBlockPause, DataBlockRaw, \
+    calc_checksum, standard_timing
+
+# Pause used after a data block when the source format did not specify one (e.g. a TAP file).
+DEFAULT_PAUSE = 1000
+
+class Writer:
+    """
+    Base class for writing blocks to a file.
+    """
+    def __init__(self, file, fix_checksums=False):
+        self.file = file
+        self.fix_checksums = fix_checksums
+
+    def write(self, block):
+        """
+        Write a block to the file. Returns False if the block cannot be represented in this format.
+        """
+        return False
+
+    def write_blocks(self, blocks, select=None):
+        """
+        Write a sequence of blocks, optionally restricted to the set of block indices in select.
+        Returns the number of blocks written.
+        """
+        count = 0
+        for i, block in enumerate(blocks):
+            if select is None or i in select:
+                if self.write(block):
+                    count += 1
+        return count
+
+    def _block_bytes(self, block):
+        """
+        Returns the flag, data and checksum of a binary block, recalculating the checksum if requested.
+        """
+        if self.fix_checksums:
+            data = bytes([block.flag]) + block.data
+            return data + bytes([calc_checksum(data)])
+        return block.raw
+
+class TAPWriter(Writer):
+    """
+    Class for writing TAP files. Only binary data blocks can be represented, all other blocks are skipped.
+    """
+    def write(self, block):
+        """
+        Write a block to the TAP file. Blocks of more than 65535 bytes (possible in a TZX turbo block) don't fit
+        the 16 bit TAP block length and are skipped with a warning.
+        """
+        if not isinstance(block, DataBlockBinary):
+            return False
+        data = self._block_bytes(block)
+        if len(data) > 0xffff:
+            print("WARNING:Skipped a {} byte block, too long for a TAP file".format(len(data)), file=sys.stderr)
+            return False
+        self.file.write(struct.pack('<H', len(data)))
+        self.file.write(data)
+        return True
+
+class TZXWriter(Writer):
+    """
+    Class for writing TZX files. The TZX header is written when the writer is created.
+    """
+    major_ver, minor_ver = 1, 20
+
+    def __init__(self, file, fix_checksums=False):
+        super(TZXWriter, self).__init__(file, fix_checksums)
+        self.file.write(struct.pack('=7sBBB', b"ZXTape!", 0x1A, TZXWriter.major_ver, TZXWriter.minor_ver))
+
+    def write(self, block):
+        """
+        Write a block to the TZX file.
+        """
+        if isinstance(block, DataBlockBinary):
+            self._write_data(block)
+        elif isinstance(block, DataBlockPause):
+            self.file.write(struct.pack('=BH', 0x20, block.pause))
+        elif isinstance(block, DataBlockArchive):
+            self._write_archive_info(block)
+        elif isinstance(block, DataBlockRaw):
+            # Blocks that aren't decoded are copied through as they were read
+            self.file.write(struct.pack('=B', block.blockid))
+            self.file.write(block.data)
+        elif isinstance(block, DataBlockAscii):
+            text = block.text.encode('utf-8')[:255]
+            self.file.write(struct.pack('=BB', 0x30, len(text)))
+            self.file.write(text)
+        else:
+            # The file header (Header) has already been written
+            return isinstance(block, Header)
+        return True
+
+    def _write_data(self, block):
+        data = self._block_bytes(block)
+        pause = DEFAULT_PAUSE if block.pause is None else block.pause
+        timing = block.timing
+        if timing is None and len(data) > 0xffff:
+            # Too long for a standard speed block so write it as a turbo block using the ROM timings
+            timing = standard_timing(block.flag)
+        if timing is None:
+            self.file.write(struct.pack('=BHH', 0x10, pause, len(data)))
+        else:
+            pilot, sync1, sync2, zero, one, pilot_tone, used_bits = timing
+            self.file.write(struct.pack('=BHHHHHHBH', 0x11, pilot, sync1, sync2, zero, one, pilot_tone, used_bits,
+                                        pause))
+            self.file.write(len(data).to_bytes(3, byteorder='little'))
+        self.file.write(data)
+
+    def _write_archive_info(self, block):
+        strings = list()
+        for typeid, text in block.descriptions:
+            text_bytes = text.encode('zxascii')[:255]
+            strings.append(struct.pack('=BB', typeid, len(text_bytes)) + text_bytes)
+        body = b''.join(strings)
+        self.file.write(struct.pack('=BHB', 0x32, len(body) + 1, len(strings)))
+        self.file.write(body)
+
+def writer_for(filename, file, fix_checksums=False):
+    """
+    Returns a writer for the output filename based on its extension.
+    """
+    if filename.lower().endswith(".tzx"):
+        return TZXWriter(file, fix_checksums)
+    if filename.lower().endswith(".tap"):
+        return TAPWriter(file, fix_checksums)
+    raise RuntimeError("The {} file is an unsupported output type (supports TZX/TAP only).".format(filename))
@@ -6,6 +6,8 @@ Creates custom text string codecs for handling ZX Spectrum strings.
 """
 
 import codecs
+import math
+import re
 import struct
 
 # Maps as many non-standard ascii values in the ZX Spectrum character map as possible.
@@ -147,25 +149,47 @@ ZX_CHAR_MAP = {
 def zx_decode_number(data):
     """
     Decode a binary string into a ZX Spectrum number (as defined in the ROM routine).
+    Returns an int for the small integer form and a float otherwise.
     """
     if len(data) != 5:
         raise AssertionError("ZX number expects a length of 5 not {}".format(len(data)))
-    number = 0
-    exponent = struct.unpack_from('=B', data, 0)[0]
+    exponent, mantissa = struct.unpack_from('>BI', data, 0)
     if exponent == 0:
-        # Special case - small number
-        sign, number = struct.unpack_from('=BH', data, 1)
+        # Special case - small integer held as a 16-bit two's complement value with a separate sign byte
+        sign, number = struct.unpack_from('<BH', data, 1)
         if sign == 0xff:
-            number *= -1
-    else:
-        exponent -= 128
-        value = struct.unpack_from('=<I', data, 1)
-        sign = bool(0x8000 & ~value)
-        number = 0x7fff & value
-        if sign:
-            number *= -1
-        number *= pow(2, exponent)
-    return str(number)
+            number -= 65536
+        return number
+    # The top bit of the mantissa holds the sign and is otherwise always set
+    number = math.ldexp(mantissa | 0x80000000, exponent - 128 - 32)
+    if mantissa & 0x80000000:
+        number = -number
+    return number
+
+def zx_encode_number(value):
+    """
+    Encode a number into the 5 byte ZX Spectrum form (as defined in the ROM routine).
+    """
+    if float(value).is_integer() and -65535 <= value <= 65535:
+        # Small integers use the special integer form
+        value = int(value)
+        return struct.pack('<BBHB', 0, 0xff if value < 0 else 0, value & 0xffff, 0)
+    if value == 0:
+        return bytes(5)
+    mantissa, exponent = math.frexp(abs(value))
+    mantissa = round(mantissa * (1 << 32))
+    if mantissa >> 32:
+        mantissa >>= 1
+        exponent += 1
+    if exponent + 128 > 255:
+        raise OverflowError("Number {} is too large for the ZX Spectrum".format(value))
+    if exponent + 128 < 1:
+        return bytes(5)
+    # The top bit of the mantissa is always set so it is replaced by the sign
+    mantissa &= 0x7fffffff
+    if value < 0:
+        mantissa |= 0x80000000
+    return struct.pack('>BI', exponent + 128, mantissa)
 
 def zx_decode_basic_string(data):
     """
@@ -177,8 +201,7 @@ def zx_decode_basic_string(data):
         if number_capture is not None:
             number_capture.append(byte)
             if len(number_capture) == 5:
-                # Numbers seem to be encoded as text and like this so ignore for now
-                # string += zx_decode_number(number_capture)
+                # The listing shows the number's text which precedes this hidden form, so it is skipped
                 number_capture = None
         elif byte == 0x0e:
             # Start of a number capture - the next 5 bytes represent a number
@@ -192,11 +215,157 @@ def zx_decode_basic_string(data):
 
     return string
 
+# Reverse of the single character entries in ZX_CHAR_MAP. The block graphic space (128) is left out so that a
+# plain space always encodes to 32.
+ZX_CHAR_REVERSE_MAP = {char: code for code, char in ZX_CHAR_MAP.items() if len(char) == 1 and code != 128}
+
+# str.translate() table that turns text into characters whose ordinals are the ZX Spectrum character codes.
+# Anything without a ZX Spectrum equivalent becomes '?'.
+_ENCODE_TABLE = {i: '?' for i in list(range(32)) + list(range(127, 256))}
+_ENCODE_TABLE.update({ord(char): chr(code) for char, code in ZX_CHAR_REVERSE_MAP.items()})
+
+def _encode_chars(text):
+    """
+    Encode text one character at a time (no keyword tokenization) into ZX Spectrum character codes.
+    """
+    return text.translate(_ENCODE_TABLE).encode('latin-1', errors='replace')
+
+def _encode_literal(text):
+    """
+    Encode the text of a string literal or REM statement, restoring UDG characters and escaped codes written
+    by the decoder but leaving keywords as plain text.
+    """
+    if '<' not in text and '!' not in text:
+        return _encode_chars(text)
+    data = bytearray()
+    pos = 0
+    for match in _LITERAL_RE.finditer(text):
+        data += _encode_chars(text[pos:match.start()])
+        data.append(144 + ord(match.group(1)) - ord('A') if match.group(1) else int(match.group(2), 16))
+        pos = match.end()
+    data += _encode_chars(text[pos:])
+    return data
+
+def _build_keyword_trie():
+    """
+    Builds a trie (nested dictionaries) over the keyword and UDG names in ZX_CHAR_MAP. The None key of a node
+    holds the (code, trailing space) tuple of the name that ends at that node.
+    """
+    names = [(text, code) for code, text in ZX_CHAR_MAP.items() if code >= 144]
+    # Common spellings that the Spectrum itself would never list
+    names += [("GOTO ", 236), ("GOSUB ", 237)]
+    trie = dict()
+    for text, code in names:
+        node = trie
+        name = text.rstrip(" ")
+        for char in name:
+            node = node.setdefault(char, dict())
+        node[None] = (code, name != text)
+    return trie
+
+_KEYWORD_TRIE = _build_keyword_trie()
+_NUMBER_RE = re.compile(r'(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?')
+_BINARY_RE = re.compile(r'[01]*')
+_DEF_FN_RE = re.compile(r'([A-Za-z]\$?\()([^)]*)\)')
+_ESCAPE_RE = re.compile(r'!0x([0-9a-fA-F]{2})! ')
+_LITERAL_RE = re.compile(r'<UDG ([A-U])>|!0x([0-9a-fA-F]{2})! ')
+_TOKEN_REM, _TOKEN_BIN, _TOKEN_DEF_FN = 234, 196, 206
+
+def _match_keyword(text, pos):
+    """
+    Returns the (code, end position) of the longest keyword starting at pos or None if there isn't one.
+    """
+    node = _KEYWORD_TRIE
+    match = None
+    end = pos
+    while end < len(text):
+        node = node.get(text[end])
+        if node is None:
+            break
+        end += 1
+        if None in node:
+            match = (node[None], end)
+    if match is None:
+        return None
+    (code, trailing_space), end = match
+    # A keyword ending in a letter cannot run straight into another letter (e.g. TO in TOTAL)
+    if text[end - 1].isalpha() and end < len(text) and text[end].isalpha():
+        return None
+    # The decoder writes a space after every keyword so absorb it
+    if trailing_space and end < len(text) and text[end] == " ":
+        end += 1
+    return code, end
+
+def _tokenize_line(text):
+    """
+    Tokenize the text of a single line of ZX Spectrum Basic (without its line number).
+    """
+    line = bytearray()
+    pos = 0
+    in_identifier = False
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            end = text.find('"', pos + 1)
+            end = len(text) if end < 0 else end + 1
+            line += _encode_literal(text[pos:end])
+            pos = end
+            in_identifier = False
+            continue
+
+        if char == '!':
+            match = _ESCAPE_RE.match(text, pos)
+            if match:
+                line.append(int(match.group(1), 16))
+                pos = match.end()
+                continue
+
+        # Keywords made of letters are never matched inside an identifier (e.g. AT in XAT or IN in AIN)
+        if char in _KEYWORD_TRIE and not (in_identifier and char.isalpha()):
+            match = _match_keyword(text, pos)
+            if match:
+                code, pos = match
+                line.append(code)
+                in_identifier = False
+                if code == _TOKEN_REM:
+                    # Everything after REM is kept as it is
+                    line += _encode_literal(text[pos:])
+                    break
+                if code == _TOKEN_BIN:
+                    match = _BINARY_RE.match(text, pos)
+                    line += match.group().encode('ascii') + b'\x0e' + zx_encode_number(int(match.group() or "0", 2))
+                    pos = match.end()
+                elif code == _TOKEN_DEF_FN:
+                    match = _DEF_FN_RE.match(text, pos)
+                    if match:
+                        # Each parameter is followed by a placeholder for its value
+                        params = [_encode_chars(param) + b'\x0e' + bytes(5)
+                                  for param in match.group(2).split(",")] if match.group(2) else []
+                        line += _encode_chars(match.group(1)) + b','.join(params) + b')'
+                        pos = match.end()
+                continue
+
+        if not in_identifier and (char.isdigit() or char == '.'):
+            match = _NUMBER_RE.match(text, pos)
+            if match:
+                line += match.group().encode('ascii') + b'\x0e' + zx_encode_number(float(match.group()))
+                pos = match.end()
+                continue
+
+        line += _encode_chars(char)
+        in_identifier = char.isalnum() or char == '$'
+        pos += 1
+    line.append(0x0d)
+    return line
+
 def zxascii_encode(text):
     """
-    Encode a ZX Spectrum ASCII string from text (not implemented).
+    Encode a ZX Spectrum ASCII string from text.
+
+    Characters are mapped one-to-one; no keyword tokenization takes place. Characters that have no ZX Spectrum
+    equivalent are encoded as '?'.
     """
-    raise AssertionError("\'zxascii\' codec does not support encoding")
+    return _encode_chars(text), len(text)
 
 def zxascii_decode(data):
     """
@@ -207,24 +376,40 @@ def zxascii_decode(data):
 
 def zxbasic_encode(text):
     """
-    Encode a ZX Spectrum Basic string from text (not implemented).
+    Encode a ZX Spectrum Basic string from text.
+
+    Each line of text must start with its line number. Keywords are tokenized using a longest match over a trie
+    of the keyword table and every numeric literal is followed by its hidden 5-byte form, producing the line
+    number/length framing read by zxbasic_decode.
     """
-    raise AssertionError("\'zxbasic\' codec does not support encoding")
+    data = bytearray()
+    for text_line in text.splitlines():
+        text_line = text_line.lstrip()
+        if not text_line:
+            continue
+        digits = len(text_line) - len(text_line.lstrip("0123456789"))
+        if digits == 0:
+            raise ValueError("ZX Basic line does not start with a line number: {}".format(text_line))
+        line_num = int(text_line[:digits])
+        body = text_line[digits + 1:] if text_line[digits:digits + 1] == " " else text_line[digits:]
+        line = _tokenize_line(body)
+        data += struct.pack('>H', line_num) + struct.pack('<H', len(line)) + line
+    return bytes(data), len(text)
 
 def zxbasic_decode(data):
     """
     Decode a binary string containing ZX Spectrum Basic code into ASCII.
     """
-    string = ""
+    lines = list()
     pos = 0
     while pos < len(data):
         line_num = struct.unpack_from('>H', data, pos)[0]
         pos += 2
         text_length = struct.unpack_from('<H', data, pos)[0]
         pos += 2
-        string += "{} {}\n".format(line_num, zx_decode_basic_string(data[pos:pos+text_length]).rstrip())
+        lines.append("{} {}".format(line_num, zx_decode_basic_string(data[pos:pos+text_length]).rstrip()))
         pos += text_length
-    string = string.rstrip()
+    string = "\n".join(lines).rstrip()
     return string, len(string)
 
 def zxascii_search_function(encoding_name):